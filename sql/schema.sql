@@ -12,9 +12,10 @@ CREATE SCHEMA IF NOT EXISTS core;
 
 
 -- =====================
--- UUID
+-- EXTENSIONS
 -- =====================
 CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
 
 
 -- ======================
@@ -107,11 +108,24 @@ CREATE TABLE IF NOT EXISTS core.company_master (
 CREATE INDEX IF NOT EXISTS idx_abr_clean_normalized_name
 ON staging.abr_clean(normalized_name);
 
+CREATE INDEX IF NOT EXISTS idx_abr_clean_normalized_name_trgm
+ON staging.abr_clean USING gin (normalized_name gin_trgm_ops);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_commoncrawl_raw_website_url
+ON staging.commoncrawl_raw(website_url);
+
 CREATE INDEX IF NOT EXISTS idx_commoncrawl_clean_normalized_name
 ON staging.commoncrawl_clean(normalized_name);
 
-CREATE INDEX IF NOT EXISTS idx_company_master_abn
-ON core.company_master(abn);
+-- Leading abn column also serves abn-only lookups, so the old
+-- single-column index is redundant
+DROP INDEX IF EXISTS core.idx_company_master_abn;
+
+CREATE INDEX IF NOT EXISTS idx_company_master_abn_company_id
+ON core.company_master(abn, company_id);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_company_master_abn_website_url
+ON core.company_master(abn, website_url);
 
 CREATE INDEX IF NOT EXISTS idx_company_master_name
 ON core.company_master(company_name);
@@ -1,8 +1,11 @@
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import Depends, FastAPI, HTTPException, Query
+from pydantic import BaseModel
 from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
 from src.db.connection import PostgresConnector
-from typing import List
+from typing import List, Optional
 import os
+import uuid
 
 # -----------------------------
 # Configuration
@@ -10,6 +13,9 @@ import os
 
 DB_PASSWORD = os.getenv("DB_PASSWORD", "firmable")
 
+# Single connector (and connection pool) shared by every request
+db = PostgresConnector(password=DB_PASSWORD)
+
 app = FastAPI(
     title="Firmable Australian Company API",
     description="API for querying unified Australian company data",
@@ -17,6 +23,30 @@ app = FastAPI(
 )
 
 
+# -----------------------------
+# Response Model
+# -----------------------------
+
+class Company(BaseModel):
+    abn: str
+    company_name: Optional[str] = None
+    website_url: Optional[str] = None
+    state: Optional[str] = None
+    postcode: Optional[str] = None
+    match_method: Optional[str] = None
+    match_confidence: Optional[float] = None
+
+
+class CompanyPage(BaseModel):
+    data: List[Company]
+    next_cursor: Optional[str] = None
+
+
+async def get_conn():
+    async with db.async_engine.connect() as conn:
+        yield conn
+
+
 # -----------------------------
 # Health Check
 # -----------------------------
@@ -33,15 +63,32 @@ def health_check():
 # Get Companies (Paginated)
 # -----------------------------
 
-@app.get("/companies")
-def get_companies(
-    limit: int = Query(10, ge=1, le=1000)
-) -> List[dict]:
-
-    db = PostgresConnector(password=DB_PASSWORD)
-
-    query = text("""
+@app.get("/companies", response_model=CompanyPage)
+async def get_companies(
+    limit: int = Query(10, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    conn: AsyncConnection = Depends(get_conn)
+) -> dict:
+
+    # Keyset pagination on (abn, company_id): each page is an index seek
+    # after the last row of the previous one, and the order is stable
+    # even though one ABN can appear on several rows
+    if cursor:
+        try:
+            cursor_abn, cursor_id = cursor.split(":", 1)
+            uuid.UUID(cursor_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+        where = "WHERE (abn, company_id) > (:cursor_abn, CAST(:cursor_id AS uuid))"
+        params = {"limit": limit, "cursor_abn": cursor_abn, "cursor_id": cursor_id}
+    else:
+        where = ""
+        params = {"limit": limit}
+
+    query = text(f"""
         SELECT 
+            company_id,
             abn,
             company_name,
             website_url,
@@ -50,15 +97,14 @@ def get_companies(
             match_method,
             match_confidence
         FROM core.company_master
+        {where}
+        ORDER BY abn, company_id
         LIMIT :limit
     """)
 
     try:
-        with db.engine.connect() as conn:
-            result = conn.execute(query, {"limit": limit})
-            rows = [dict(row._mapping) for row in result]
-
-        return rows
+        result = await conn.execute(query, params)
+        rows = [dict(row) for row in result.mappings().all()]
 
     except Exception as e:
         raise HTTPException(
@@ -66,31 +112,45 @@ def get_companies(
             detail=f"Database error: {str(e)}"
         )
 
+    next_cursor = None
+    if len(rows) == limit:
+        last = rows[-1]
+        next_cursor = f"{last['abn']}:{last['company_id']}"
+
+    return {"data": rows, "next_cursor": next_cursor}
+
 
 # -----------------------------
 # Get Company by ABN
 # -----------------------------
 
-@app.get("/company/{abn}")
-def get_company_by_abn(abn: str):
-
-    db = PostgresConnector(password=DB_PASSWORD)
+@app.get("/company/{abn}", response_model=Company)
+async def get_company_by_abn(abn: str, conn: AsyncConnection = Depends(get_conn)):
 
+    # Explicit columns (same contract as /companies); served by the
+    # leading abn column of idx_company_master_abn_company_id
     query = text("""
-        SELECT *
+        SELECT 
+            abn,
+            company_name,
+            website_url,
+            state,
+            postcode,
+            match_method,
+            match_confidence
         FROM core.company_master
         WHERE abn = :abn
+        LIMIT 1
     """)
 
     try:
-        with db.engine.connect() as conn:
-            result = conn.execute(query, {"abn": abn})
-            row = result.fetchone()
+        result = await conn.execute(query, {"abn": abn})
+        row = result.mappings().first()
 
         if not row:
             raise HTTPException(status_code=404, detail="Company not found")
 
-        return dict(row._mapping)
+        return dict(row)
 
     except HTTPException:
         raise
@@ -1,7 +1,47 @@
+import csv
+import io
+import os
+from functools import lru_cache
+
+from psycopg2.extras import execute_batch
 from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import create_async_engine
 import pandas as pd
 
 
+# Per-engine pool limits, per process: each engine opens at most
+# DB_POOL_SIZE + DB_MAX_OVERFLOW connections, and a process may hold a
+# sync and an async engine. Keep processes x 2 x (size + overflow) under
+# the server's max_connections (100 by default) — see README.
+POOL_SIZE    = int(os.getenv("DB_POOL_SIZE", "5"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+
+
+@lru_cache(maxsize=None)
+def get_engine(connection_string):
+    # One pooled engine per database URL, shared by every connector
+    return create_engine(
+        connection_string,
+        pool_size=POOL_SIZE,
+        max_overflow=MAX_OVERFLOW,
+        pool_pre_ping=True,
+        pool_recycle=3600,
+        future=True,
+    )
+
+
+@lru_cache(maxsize=None)
+def get_async_engine(connection_string):
+    # asyncpg-backed engine for the API, one per database URL
+    return create_async_engine(
+        connection_string,
+        pool_size=POOL_SIZE,
+        max_overflow=MAX_OVERFLOW,
+        pool_pre_ping=True,
+        pool_recycle=3600,
+    )
+
+
 class PostgresConnector:
     def __init__(
         self,
@@ -11,21 +51,103 @@ class PostgresConnector:
         user="postgres",
         password="firmable",
     ):
+        # Driver pinned: copy_expert, execute_batch and pgcopy need psycopg2
+        # connections, and a bare postgresql:// may resolve to psycopg 3
         self.connection_string = (
-            f"postgresql://{user}:{password}@{host}:{port}/{database}"
+            f"postgresql+psycopg2://{user}:{password}@{host}:{port}/{database}"
         )
-        self.engine = create_engine(self.connection_string, future=True)
-
-    def insert_dataframe(self, df: pd.DataFrame, table_name: str, schema: str):
-        df.to_sql(
-            name=table_name,
-            con=self.engine,
-            schema=schema,
-            if_exists="append",
-            index=False,
-            method="multi",
+        self.async_connection_string = (
+            f"postgresql+asyncpg://{user}:{password}@{host}:{port}/{database}"
+        )
+        self.engine = get_engine(self.connection_string)
+
+    @property
+    def async_engine(self):
+        return get_async_engine(self.async_connection_string)
+
+    def copy_dataframe_ignore_conflicts(self, df: pd.DataFrame, table_name: str, schema: str):
+        # COPY into a temp table, then merge with ON CONFLICT DO NOTHING so
+        # rows that break a unique index are skipped instead of failing.
+        # Returns the number of rows actually inserted.
+        buf = io.StringIO()
+        df.to_csv(buf, index=False, header=False, na_rep="\\N")
+        buf.seek(0)
+
+        columns = ", ".join(df.columns)
+        tmp_table = f"tmp_{table_name}"
+
+        raw = self.engine.raw_connection()
+        try:
+            with raw.cursor() as cur:
+                cur.execute(
+                    f"CREATE TEMP TABLE {tmp_table} "
+                    f"(LIKE {schema}.{table_name} INCLUDING DEFAULTS) ON COMMIT DROP"
+                )
+                cur.copy_expert(
+                    f"COPY {tmp_table} ({columns}) "
+                    f"FROM STDIN WITH (FORMAT CSV, NULL '\\N')",
+                    buf,
+                )
+                cur.execute(
+                    f"INSERT INTO {schema}.{table_name} ({columns}) "
+                    f"SELECT {columns} FROM {tmp_table} "
+                    f"ON CONFLICT DO NOTHING"
+                )
+                inserted = cur.rowcount
+            raw.commit()
+        except Exception:
+            raw.rollback()
+            raise
+        finally:
+            raw.close()
+
+        return inserted
+
+    def copy_records(self, records, columns, table_name: str, schema: str):
+        # COPY streams plain tuples in one go, with no DataFrame built and
+        # no multi-VALUES INSERT for Postgres to parse
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        for record in records:
+            writer.writerow(["\\N" if value is None else value for value in record])
+        buf.seek(0)
+
+        self._copy_buffer(buf, columns, table_name, schema)
+
+    def execute_batch(self, sql: str, rows, page_size: int = 500):
+        # psycopg2's execute_batch joins page_size statements into one
+        # round-trip; SQLAlchemy falls back to a plain row-by-row
+        # executemany for text() INSERTs. sql uses %(name)s placeholders.
+        raw = self.engine.raw_connection()
+        try:
+            with raw.cursor() as cur:
+                execute_batch(cur, sql, rows, page_size=page_size)
+            raw.commit()
+        except Exception:
+            raw.rollback()
+            raise
+        finally:
+            raw.close()
+
+    def _copy_buffer(self, buf, columns, table_name: str, schema: str):
+        copy_sql = (
+            f"COPY {schema}.{table_name} ({', '.join(columns)}) "
+            f"FROM STDIN WITH (FORMAT CSV, NULL '\\N')"
         )
 
+        # raw_connection() checks a connection out of the engine pool, so
+        # consecutive batches reuse the same underlying connection
+        raw = self.engine.raw_connection()
+        try:
+            with raw.cursor() as cur:
+                cur.copy_expert(copy_sql, buf)
+            raw.commit()
+        except Exception:
+            raw.rollback()
+            raise
+        finally:
+            raw.close()
+
     def test_connection(self):
         with self.engine.connect() as conn:
             result = conn.execute(text("SELECT current_database();"))
@@ -1,13 +1,50 @@
 import os
 import glob
-import pandas as pd
-import xml.etree.ElementTree as ET
+import argparse
+import time
+from datetime import date
+from lxml import etree as ET
+from pgcopy import CopyManager
 from tqdm import tqdm
 from src.db.connection import PostgresConnector
 
 
+def _first(nodes):
+    return nodes[0] if nodes else None
+
+
+def _parse_date(value):
+    # ABR dates are YYYYMMDD; binary COPY needs a real date object
+    try:
+        return date(int(value[:4]), int(value[4:6]), int(value[6:8]))
+    except (TypeError, ValueError):
+        return None
+
+
 class ABRParser:
-    def __init__(self, db_password, data_path="data/raw/abr", limit=10000, batch_size=1000):
+    # Column order of the tuples returned by extract_record
+    COLUMNS = [
+        "abn",
+        "entity_name",
+        "entity_type",
+        "entity_status",
+        "address_line",
+        "postcode",
+        "state",
+        "start_date",
+    ]
+
+    # XPath expressions compiled once instead of re-walked per record;
+    # plain strings so results don't keep the parsed element alive
+    _XP_ENTITY_NAME = ET.XPath("MainEntity/NonIndividualName/NonIndividualNameText/text()", smart_strings=False)
+    _XP_ENTITY_TYPE = ET.XPath("EntityType/EntityTypeText/text()", smart_strings=False)
+    _XP_POSTCODE = ET.XPath("MainEntity/BusinessAddress/AddressDetails/Postcode/text()", smart_strings=False)
+    _XP_STATE = ET.XPath("MainEntity/BusinessAddress/AddressDetails/State/text()", smart_strings=False)
+
+    # Batch sizes swept by benchmark_batch_sizes()
+    BENCHMARK_BATCH_SIZES = (1000, 5000, 20000, 50000)
+
+    def __init__(self, db_password, data_path="data/raw/abr", limit=10000, batch_size=20000):
         self.db = PostgresConnector(password=db_password)
         self.data_path = data_path
         self.limit = limit
@@ -29,72 +66,88 @@ class ABRParser:
     # ---------------------------------
     def extract_record(self, element):
         try:
-            abn = element.findtext("ABN")
-
-            entity_name = element.findtext(
-                "MainEntity/NonIndividualName/NonIndividualNameText"
-            )
-
-            entity_type = element.findtext(
-                "EntityType/EntityTypeText"
-            )
-
-            entity_status = element.find("ABN").attrib.get("status") if element.find("ABN") is not None else None
-
-            postcode = element.findtext(
-                "MainEntity/BusinessAddress/AddressDetails/Postcode"
-            )
-
-            state = element.findtext(
-                "MainEntity/BusinessAddress/AddressDetails/State"
+            abn_el = element.find("ABN")
+
+            if abn_el is not None:
+                abn = abn_el.text
+                entity_status = abn_el.get("status")
+                start_date = _parse_date(abn_el.get("ABNStatusFromDate"))
+            else:
+                abn = entity_status = start_date = None
+
+            return (
+                abn,
+                _first(self._XP_ENTITY_NAME(element)),
+                _first(self._XP_ENTITY_TYPE(element)),
+                entity_status,
+                None,
+                _first(self._XP_POSTCODE(element)),
+                _first(self._XP_STATE(element)),
+                start_date,
             )
 
-            start_date = element.find("ABN").attrib.get("ABNStatusFromDate") if element.find("ABN") is not None else None
-
-            return {
-                "abn": abn,
-                "entity_name": entity_name,
-                "entity_type": entity_type,
-                "entity_status": entity_status,
-                "address_line": None,
-                "postcode": postcode,
-                "state": state,
-                "start_date": start_date,
-            }
-
         except Exception:
             return None
 
     # ---------------------------------
     # Parse Single XML File (Streaming)
     # ---------------------------------
-    def parse_file(self, file_path):
+    def parse_file(self, file_path, batch_size=None, commit=True):
         print(f"Processing file: {file_path}")
 
+        batch_size = batch_size or self.batch_size
         records = []
         total_processed = 0
 
-        context = ET.iterparse(file_path, events=("end",))
+        # One transaction for the whole file so the commit/fsync cost is
+        # paid once instead of once per batch
+        raw = self.db.engine.raw_connection()
 
-        for event, elem in context:
-            if elem.tag == "ABR":
+        try:
+            # Binary COPY: values go over the wire in Postgres' own tuple
+            # format, so nothing is rendered to text and parsed back
+            copy_mgr = CopyManager(
+                raw.driver_connection, "staging.abr_raw", self.COLUMNS
+            )
+
+            context = ET.iterparse(file_path, events=("end",), tag="ABR", huge_tree=False)
+
+            for event, elem in context:
                 record = self.extract_record(elem)
 
-                if record and record["abn"]:
+                if record and record[0]:
                     records.append(record)
                     total_processed += 1
 
-                if len(records) >= self.batch_size:
-                    self.insert_batch(records)
+                if len(records) >= batch_size:
+                    self.insert_batch(records, copy_mgr)
                     records = []
 
                 if total_processed >= self.limit:
                     break
 
+                # Free the record and any already-processed siblings so the
+                # root element doesn't keep growing on multi-GB files
                 elem.clear()
+                while elem.getprevious() is not None:
+                    del elem.getparent()[0]
+
+            del context
+
+            if records:
+                self.insert_batch(records, copy_mgr)
 
-        if records:
-            self.insert_batch(records)
+            if commit:
+                raw.commit()
+            else:
+                raw.rollback()
+
+        except Exception:
+            raw.rollback()
+            raise
+
+        finally:
+            raw.close()
 
         print(f"Finished file: {file_path}")
         return total_processed
@@ -102,19 +155,30 @@ class ABRParser:
     # ---------------------------------
     # Insert Batch Into DB
     # ---------------------------------
-    def insert_batch(self, records):
-        df = pd.DataFrame(records)
+    def insert_batch(self, records, copy_mgr):
+        copy_mgr.copy(records)
 
-        df.to_sql(
-            name="abr_raw",
-            con=self.db.engine,
-            schema="staging",
-            if_exists="append",
-            index=False,
-            method="multi",
-        )
+        print(f"Inserted batch of {len(records)} records")
 
-        print(f"Inserted batch of {len(df)} records")
+    # ---------------------------------
+    # Benchmark Batch Sizes
+    # ---------------------------------
+    def benchmark_batch_sizes(self, file_path, batch_sizes=BENCHMARK_BATCH_SIZES):
+        # Each run is rolled back, so the sweep leaves staging.abr_raw untouched
+        results = {}
+
+        for batch_size in batch_sizes:
+            start = time.perf_counter()
+            count = self.parse_file(file_path, batch_size=batch_size, commit=False)
+            elapsed = time.perf_counter() - start
+
+            rate = count / elapsed if elapsed > 0 else 0
+            results[batch_size] = rate
+            print(f"batch_size={batch_size:,}: {count:,} rows in {elapsed:.2f}s ({rate:,.0f} rows/sec)")
+
+        best = max(results, key=results.get)
+        print(f"\nFastest batch size: {best:,}")
+        return best
 
     # ---------------------------------
     # Run Full Parsing
@@ -142,10 +206,25 @@ class ABRParser:
 if __name__ == "__main__":
     PASSWORD = "firmable"
 
+    arg_parser = argparse.ArgumentParser(description="Load ABR bulk extract XML into staging.abr_raw")
+    arg_parser.add_argument("--limit", type=int, default=500000)
+    arg_parser.add_argument("--batch-size", type=int, default=20000)
+    arg_parser.add_argument(
+        "--benchmark",
+        action="store_true",
+        help="Time each batch size on the first XML file and load with the fastest",
+    )
+    args = arg_parser.parse_args()
+
     parser = ABRParser(
         db_password=PASSWORD,
-        limit=500000,     
-        batch_size=1000
+        limit=args.limit,
+        batch_size=args.batch_size
     )
 
-    parser.run()
+    if args.benchmark:
+        xml_files = glob.glob(os.path.join(parser.data_path, "*.xml"))
+        if xml_files:
+            parser.batch_size = parser.benchmark_batch_sizes(xml_files[0])
+
+    parser.run()
\ No newline at end of file
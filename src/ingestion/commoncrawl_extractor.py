@@ -1,12 +1,25 @@
 import requests
-import json
-from urllib.parse import urlparse
+import orjson
+import re
 import pandas as pd
 import time
+import xxhash
 from requests.exceptions import ChunkedEncodingError, ConnectionError
 from src.db.connection import PostgresConnector
 
 
+# Leading "www." and the trailing .au suffix stripped in one pass; both are
+# anchored, so "www." / ".au" text inside the name is kept
+_DOMAIN_AFFIX_RE = re.compile(r"^www\.|\.(?:com|net|org|asn)\.au$|\.au$")
+_HYPHEN_TO_SPACE = str.maketrans("-", " ")
+
+# Hostname of an absolute URL, matched only when it ends in .au
+_AU_HOST_RE = re.compile(
+    r"^[a-z][a-z0-9+.-]*://(?:[^/?#@]*@)?([^/?#@:]+\.au)(?::\d*)?(?:[/?#]|$)",
+    re.IGNORECASE,
+)
+
+
 class FastCommonCrawlExtractor:
 
     def __init__(
@@ -21,30 +34,35 @@ class FastCommonCrawlExtractor:
         self.max_pages = max_pages
         self.batch_size = batch_size
         self.base_url = f"https://index.commoncrawl.org/{self.crawl_index}-index"
+        self.db = None
 
-    def is_valid_domain(self, domain):
-        if not domain:
-            return False
-        return domain.lower().endswith(".au")
+    def extract_au_domain(self, url):
+        # One C-level regex match replaces urlparse + an endswith(".au")
+        # check on the per-URL hot path
+        match = _AU_HOST_RE.match(url)
+        return match.group(1).lower() if match else None
 
     def domain_to_company_name(self, domain):
-        name = domain.lower()
-        name = name.replace("www.", "")
-        name = name.replace(".com.au", "")
-        name = name.replace(".net.au", "")
-        name = name.replace(".org.au", "")
-        name = name.replace(".asn.au", "")
-        name = name.replace(".au", "")
-        name = name.replace("-", " ")
-        name = name.strip()
-        return name.title()
+        """
+        >>> FastCommonCrawlExtractor().domain_to_company_name("www.acme-plumbing.com.au")
+        'Acme Plumbing'
+
+        Only the affixes go; the old chained str.replace also cut the
+        ".au" out of ".auburn" and returned "Shopburn" here:
+
+        >>> FastCommonCrawlExtractor().domain_to_company_name("shop.auburn.com.au")
+        'Shop.Auburn'
+        """
+        name = _DOMAIN_AFFIX_RE.sub("", domain.lower())
+        return name.translate(_HYPHEN_TO_SPACE).strip().title()
 
     def insert_batch(self, domains_batch, db_password):
 
         if not domains_batch:
             return 0
 
-        db = PostgresConnector(password=db_password)
+        if self.db is None:
+            self.db = PostgresConnector(password=db_password)
 
         data = []
 
@@ -57,19 +75,16 @@ class FastCommonCrawlExtractor:
 
         df = pd.DataFrame(data)
 
-        df.to_sql(
-            name="commoncrawl_raw",
-            con=db.engine,
-            schema="staging",
-            if_exists="append",
-            index=False,
-            method="multi",
-            chunksize=2000
+        # Uniqueness on website_url lives in the database, so re-runs and
+        # restarts after a crash don't duplicate rows
+        inserted = self.db.copy_dataframe_ignore_conflicts(
+            df, table_name="commoncrawl_raw", schema="staging"
         )
 
-        print(f"Inserted batch of {len(df)} records into DB")
+        print(f"Inserted batch of {inserted} new records into DB "
+              f"({len(df) - inserted} already present)")
 
-        return len(df)
+        return inserted
 
     def run(self, db_password):
 
@@ -78,7 +93,12 @@ class FastCommonCrawlExtractor:
             "output": "json"
         }
 
+        # Per-batch dedup only: the unique index on website_url handles
+        # repeats across batches. CDX lines are sorted by host, so a
+        # domain's URLs arrive together and rarely straddle a batch.
+        # 64-bit fingerprints keep the set small for large batch sizes.
         seen_domains = set()
+        domain_hash = xxhash.xxh3_64_intdigest
         domains_batch = []
 
         total_collected = 0
@@ -107,14 +127,15 @@ class FastCommonCrawlExtractor:
 
                 page_count = 0
 
-                for line in response.iter_lines(decode_unicode=True):
+                # orjson parses the raw bytes directly, no str decode first
+                for line in response.iter_lines():
 
                     if not line:
                         continue
 
                     try:
-                        record = json.loads(line)
-                    except json.JSONDecodeError:
+                        record = orjson.loads(line)
+                    except orjson.JSONDecodeError:
                         # Skip malformed / partial lines from Common Crawl
                         continue
 
@@ -122,16 +143,16 @@ class FastCommonCrawlExtractor:
                     if not url:
                         continue
 
-                    parsed = urlparse(url)
-                    domain = parsed.hostname
-
-                    if not self.is_valid_domain(domain):
+                    domain = self.extract_au_domain(url)
+                    if domain is None:
                         continue
 
-                    if domain in seen_domains:
+                    domain_key = domain_hash(domain)
+
+                    if domain_key in seen_domains:
                         continue
 
-                    seen_domains.add(domain)
+                    seen_domains.add(domain_key)
                     domains_batch.append(domain)
 
                     page_count += 1
@@ -141,6 +162,7 @@ class FastCommonCrawlExtractor:
                         inserted = self.insert_batch(domains_batch, db_password)
                         total_inserted += inserted
                         domains_batch = []
+                        seen_domains.clear()
 
                 print(f"Page {page} collected: {page_count}")
                 print(f"Total collected so far: {total_collected}")
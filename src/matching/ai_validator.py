@@ -1,15 +1,107 @@
 
 from __future__ import annotations
-import json
+import asyncio
+import os
 import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
 
+import httpx
+import orjson
 import requests
+from rapidfuzz import fuzz
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # ── Compiled once at import ──────────────────────────────────────────────────
 _MD_FENCE_RE   = re.compile(r"```(?:json)?", re.IGNORECASE)
-_JSON_BLOCK_RE = re.compile(r"\{[^{}]*\}", re.DOTALL)
+# Matched against already lower-cased names, so no IGNORECASE
+_SUFFIX_RE     = re.compile(r"\b(limited|holdings|group|corp|pty|ltd|inc)\b")
+_PUNCT_RE      = re.compile(r"[^\w\s]")
+_WHITESPACE_RE = re.compile(r"\s+")
 # ────────────────────────────────────────────────────────────────────────────
 
+# ── Rule-based short-circuit thresholds (0–100) ─────────────────────────────
+RULE_SAME_MIN = 95   # token_sort_ratio >= 95 → same entity without the LLM
+RULE_DIFF_MAX = 40   # token_set_ratio  <  40 → different entity without the LLM
+# ────────────────────────────────────────────────────────────────────────────
+
+# ── Prompt / request constants (built once, not per call) ───────────────────
+_PROMPT_HEAD = "Same Australian business entity?\n"
+_PROMPT_TAIL = (
+    "Ignore: Pty Ltd / Ltd / Limited / Holdings / Group / state codes / punctuation.\n"
+    "Be conservative.\n"
+    "Reply ONLY with JSON: "
+    '{"same_entity":true/false,"confidence":0.0-1.0,"reason":"brief"}'
+)
+_BATCH_PROMPT_HEAD = (
+    "For each numbered pair, is A the same Australian business entity as B?\n"
+    "Ignore: Pty Ltd / Ltd / Limited / Holdings / Group / state codes / punctuation.\n"
+    "Be conservative.\n"
+)
+_BATCH_PROMPT_TAIL = (
+    "Reply ONLY with a JSON array, one object per pair: "
+    '[{"index":1,"same_entity":true/false,"confidence":0.0-1.0,"reason":"brief"}]'
+)
+_JSON_HEADERS = {"Content-Type": "application/json"}
+# Part of every cache key: bump when the prompt text above changes so
+# persisted answers to the old wording are not reused
+PROMPT_VERSION = 1
+# ────────────────────────────────────────────────────────────────────────────
+
+# LLM answers survive between runs here (see save_cache)
+DEFAULT_CACHE_PATH = Path.home() / ".cache" / "entity_matcher" / "ai_cache.json"
+
+
+def _find_json_block(text: str, open_ch: str = "{", close_ch: str = "}") -> str | None:
+    """
+    Return the first balanced {...} block in text (nested objects included),
+    or None if none closes. Braces inside JSON strings are ignored. Pass
+    open_ch="[", close_ch="]" for arrays.
+
+    A block that never closes (e.g. a quoted brace in the prose before the
+    JSON) is skipped and the scan restarts at the next opening bracket:
+
+    >>> _find_json_block('"{" {"a":1}')
+    '{"a":1}'
+    >>> _find_json_block('Answer: {"reason": "uses } and {", "ok": true} done')
+    '{"reason": "uses } and {", "ok": true}'
+    """
+    start = text.find(open_ch)
+    while start != -1:
+        depth     = 0
+        in_string = False
+        escaped   = False
+
+        for i in range(start, len(text)):
+            ch = text[i]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif ch == "\\":
+                    escaped = True
+                elif ch == '"':
+                    in_string = False
+            elif ch == '"':
+                in_string = True
+            elif ch == open_ch:
+                depth += 1
+            elif ch == close_ch:
+                depth -= 1
+                if depth == 0:
+                    return text[start:i + 1]
+
+        start = text.find(open_ch, start + 1)
+
+    return None
+
+
+def _rule_normalize(name: str) -> str:
+    name = _SUFFIX_RE.sub("", name.lower())
+    name = _PUNCT_RE.sub(" ", name)
+    return _WHITESPACE_RE.sub(" ", name).strip()
+
 
 class AIValidator:
     """
@@ -17,30 +109,58 @@ class AIValidator:
 
     Parameters
     ----------
-    model   : Ollama model tag, default "phi3:mini"
-    timeout : HTTP timeout in seconds, default 20
+    model           : Ollama model tag, default "phi3:mini"
+    timeout         : HTTP timeout in seconds, default 20
+    max_concurrency : In-flight requests for validate_many, default 8
+    cache_size      : LLM answers kept in the in-memory LRU, default 100_000
+    cache_path      : JSON file the LRU is loaded from and saved to,
+                      default ~/.cache/entity_matcher/ai_cache.json; None
+                      keeps the cache in memory only
     """
 
-    def __init__(self, model: str = "phi3:mini", timeout: int = 20):
-        self.model   = model
-        self.url     = "http://localhost:11434/api/generate"
-        self.timeout = timeout
-        # One persistent session → one TCP connection reused for all calls
+    def __init__(
+        self,
+        model:           str = "phi3:mini",
+        timeout:         int = 20,
+        max_concurrency: int = 8,
+        cache_size:      int = 100_000,
+        cache_path:      str | Path | None = DEFAULT_CACHE_PATH,
+    ):
+        self.model           = model
+        self.url             = "http://localhost:11434/api/generate"
+        self.timeout         = timeout
+        self.max_concurrency = max_concurrency
+        # One persistent session with a keep-alive pool sized for concurrent
+        # callers; connection errors (e.g. Ollama still starting) are retried
         self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=max_concurrency,
+            pool_maxsize=max_concurrency,
+            max_retries=Retry(total=2, backoff_factor=0.1),
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # Raw LLM output keyed on model, prompt version and the sorted
+        # normalised pair, so repeated and mirrored comparisons skip the
+        # round-trip but a new model or prompt never reuses old answers
+        self.cache_size  = cache_size
+        self._cache      = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.cache_path  = Path(cache_path) if cache_path is not None else None
+        self._load_cache()
 
     # ── Prompt builder ────────────────────────────────────────────────────────
 
     def _build_prompt(self, name_a: str, name_b: str) -> str:
-        # Minimal tokens = faster prefill on Phi3:mini
-        return (
-            f'Same Australian business entity?\n'
-            f'A: "{name_a}"\n'
-            f'B: "{name_b}"\n'
-            f'Ignore: Pty Ltd / Ltd / Limited / Holdings / Group / state codes / punctuation.\n'
-            f'Be conservative.\n'
-            f'Reply ONLY with JSON: '
-            f'{{"same_entity":true/false,"confidence":0.0-1.0,"reason":"brief"}}'
+        # Minimal tokens = faster prefill on Phi3:mini; only the names vary
+        return f'{_PROMPT_HEAD}A: "{name_a}"\nB: "{name_b}"\n{_PROMPT_TAIL}'
+
+    def _build_batch_prompt(self, pairs: list[tuple[str, str]]) -> str:
+        numbered = "".join(
+            f'{i}) A: "{name_a}" B: "{name_b}"\n'
+            for i, (name_a, name_b) in enumerate(pairs, 1)
         )
+        return f"{_BATCH_PROMPT_HEAD}{numbered}{_BATCH_PROMPT_TAIL}"
 
     # ── JSON extraction ───────────────────────────────────────────────────────
 
@@ -50,67 +170,230 @@ class AIValidator:
 
         # Fast path — entire response is already valid JSON
         try:
-            return json.loads(cleaned)
-        except json.JSONDecodeError:
+            return orjson.loads(cleaned)
+        except orjson.JSONDecodeError:
             pass
 
-        # Fallback — grab the first {...} block
-        m = _JSON_BLOCK_RE.search(cleaned)
-        if m:
-            return json.loads(m.group())
+        # Fallback — grab the first balanced {...} block
+        block = _find_json_block(cleaned)
+        if block is not None:
+            return orjson.loads(block)
 
         raise ValueError(f"No valid JSON in LLM response: {cleaned!r}")
 
-    # ── Public API ────────────────────────────────────────────────────────────
+    def _split_batch(self, raw: str, n_pairs: int) -> dict[int, dict]:
+        """
+        Map 1-based pair number → answer object from a batch reply.
+        Unparseable replies give {}; out-of-range or malformed items are
+        dropped, so the caller can re-ask just those pairs.
+        """
+        cleaned = _MD_FENCE_RE.sub("", raw).strip()
+        try:
+            items = orjson.loads(cleaned)
+        except orjson.JSONDecodeError:
+            block = _find_json_block(cleaned, "[", "]")
+            try:
+                items = orjson.loads(block) if block is not None else None
+            except orjson.JSONDecodeError:
+                items = None
 
-    def validate(self, name_a: str, name_b: str) -> dict:
+        if not isinstance(items, list):
+            return {}
+
+        answers = {}
+        for pos, item in enumerate(items, 1):
+            if not isinstance(item, dict):
+                continue
+            index = item.get("index", pos)
+            if isinstance(index, int) and 1 <= index <= n_pairs:
+                answers[index] = item
+        return answers
+
+    # ── Rule-based pre-check ──────────────────────────────────────────────────
+
+    def _rule_based(self, name_a: str, name_b: str) -> dict | None:
         """
-        Validate whether two names refer to the same entity.
+        Decide trivially-equal / trivially-different pairs without the LLM.
+        Returns a validate()-shaped result, or None to fall through to Ollama.
+        """
+        norm_a = _rule_normalize(name_a or "")
+        norm_b = _rule_normalize(name_b or "")
 
-        Returns
-        -------
-        {
-            "prompt":       str,
-            "raw_response": str,
-            "parsed": {
-                "same_entity": bool,
-                "confidence":  float,   # 0.0 – 1.0
-                "reason":      str,
+        # "Same" needs the whole names to agree (word order aside):
+        # token_set_ratio gives any token subset 100, e.g. "acme" vs
+        # "acme plumbing sydney", so it only decides the clear rejects
+        score = fuzz.token_sort_ratio(norm_a, norm_b)
+        if score >= RULE_SAME_MIN:
+            scorer = "token_sort_ratio"
+            parsed = {
+                "same_entity": True,
+                "confidence":  0.99,
+                "reason":      f"Rule-based: names match after normalisation ({score:.0f})",
             }
+        else:
+            scorer = "token_set_ratio"
+            score  = fuzz.token_set_ratio(norm_a, norm_b)
+            if score >= RULE_DIFF_MAX:
+                return None
+            parsed = {
+                "same_entity": False,
+                "confidence":  0.99,
+                "reason":      f"Rule-based: names clearly differ ({score:.0f})",
+            }
+
+        return {
+            "prompt":       None,
+            "raw_response": f"rule_based {scorer}={score:.1f}",
+            "parsed":       parsed,
         }
-        """
-        prompt = self._build_prompt(name_a, name_b)
 
-        # ── LLM call ─────────────────────────────────────────────────────────
+    # ── Answer cache ──────────────────────────────────────────────────────────
+
+    def _cache_key(self, name_a: str, name_b: str) -> tuple[str, int, str, str]:
+        norm_a = _rule_normalize(name_a or "")
+        norm_b = _rule_normalize(name_b or "")
+        if norm_a > norm_b:
+            norm_a, norm_b = norm_b, norm_a
+        return (self.model, PROMPT_VERSION, norm_a, norm_b)
+
+    def _cache_get(self, key: tuple[str, int, str, str]) -> str | None:
+        with self._cache_lock:
+            raw_output = self._cache.get(key)
+            if raw_output is not None:
+                self._cache.move_to_end(key)
+            return raw_output
+
+    def _cache_put(self, key: tuple[str, int, str, str], raw_output: str) -> None:
+        with self._cache_lock:
+            self._cache[key] = raw_output
+            self._cache.move_to_end(key)
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _load_cache(self) -> None:
+        if self.cache_path is None or not self.cache_path.exists():
+            return
+        # A list of [model, prompt_version, norm_a, norm_b, raw_output],
+        # least recently used first
         try:
-            resp = self.session.post(
-                self.url,
-                json={
-                    "model":  self.model,
-                    "prompt": prompt,
-                    "stream": False,
-                    "options": {
-                        "num_predict": 60,   # ~40 tokens needed; 60 is safe ceiling
-                        "temperature": 0.0,  # deterministic = consistent + faster
-                    },
-                },
-                timeout=self.timeout,
-            )
+            entries = orjson.loads(self.cache_path.read_bytes())
+            loaded  = OrderedDict()
+            # Keep the most recently used entries if cache_size shrank
+            for model, version, norm_a, norm_b, raw_output in (
+                entries[max(0, len(entries) - self.cache_size):]
+            ):
+                if not isinstance(raw_output, str):
+                    raise TypeError(f"raw_output is {type(raw_output).__name__}")
+                loaded[(model, version, norm_a, norm_b)] = raw_output
+        except (OSError, orjson.JSONDecodeError, TypeError, ValueError) as exc:
+            # A corrupt or old-format cache only costs LLM calls — start empty
+            print(f"  [AI CACHE] could not load {self.cache_path}: {exc}")
+            return
+        self._cache = loaded
+
+    def save_cache(self) -> None:
+        """Persist the LRU to cache_path so the next run starts warm."""
+        if self.cache_path is None:
+            return
+        with self._cache_lock:
+            entries = [[*key, raw_output] for key, raw_output in self._cache.items()]
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        # Write-then-rename so an interrupted save never leaves a torn file
+        tmp_path = self.cache_path.with_suffix(".tmp")
+        tmp_path.write_bytes(orjson.dumps(entries))
+        os.replace(tmp_path, self.cache_path)
+
+    # ── Request / response helpers ────────────────────────────────────────────
+
+    def _payload(self, prompt: str, n_pairs: int = 1) -> bytes:
+        # Serialised with orjson straight to bytes; sent as the raw body
+        return orjson.dumps({
+            "model":  self.model,
+            "prompt": prompt,
+            "stream": True,
+            "options": {
+                "num_predict": 60 * n_pairs,   # ~40 tokens per answer; 60 is safe ceiling
+                "temperature": 0.0,            # deterministic = consistent + faster
+            },
+        })
+
+    @staticmethod
+    def _take_event(line, chunks: list[str], open_ch: str, close_ch: str) -> bool:
+        """
+        Add one streamed Ollama event's text to chunks. Returns True once
+        the answer is complete: the event says done, or a balanced
+        open_ch…close_ch block has arrived (re-scanned only when a
+        close_ch shows up).
+        """
+        event = orjson.loads(line)
+        piece = event.get("response", "")
+        chunks.append(piece)
+        return bool(event.get("done")) or (
+            close_ch in piece
+            and _find_json_block("".join(chunks), open_ch, close_ch) is not None
+        )
+
+    def _generate_streaming(self, prompt: str) -> str:
+        """
+        Stream the generation and keep only the text up to the first
+        complete {...} block, ignoring anything Ollama appends after it.
+        """
+        chunks, complete = [], False
+        with self.session.post(
+            self.url,
+            data=self._payload(prompt),
+            headers=_JSON_HEADERS,
+            timeout=self.timeout,
+            stream=True,
+        ) as resp:
             resp.raise_for_status()
-            raw_output = resp.json().get("response", "").strip()
+            # Read to the end even once the answer is complete: hanging up
+            # mid-stream would drop the pooled keep-alive connection
+            for line in resp.iter_lines():
+                if line and not complete:
+                    complete = self._take_event(line, chunks, "{", "}")
 
-        except Exception as exc:
-            return {
-                "prompt":       prompt,
-                "raw_response": str(exc),
-                "parsed": {
-                    "same_entity": False,
-                    "confidence":  0.0,
-                    "reason":      "LLM request failed",
-                },
-            }
+        return "".join(chunks).strip()
 
-        # ── Parse ─────────────────────────────────────────────────────────────
+    async def _agenerate_streaming(
+        self,
+        prompt:  str,
+        client:  httpx.AsyncClient,
+        n_pairs: int = 1,
+    ) -> str:
+        """
+        Async _generate_streaming on a caller-owned httpx.AsyncClient; a
+        batch prompt (n_pairs > 1) is complete once its [...] array closes.
+        """
+        open_ch, close_ch = ("[", "]") if n_pairs > 1 else ("{", "}")
+        chunks, complete = [], False
+        async with client.stream(
+            "POST",
+            self.url,
+            content=self._payload(prompt, n_pairs=n_pairs),
+            headers=_JSON_HEADERS,
+            timeout=self.timeout * n_pairs,
+        ) as resp:
+            resp.raise_for_status()
+            # Drained to the end so the connection goes back to the pool
+            async for line in resp.aiter_lines():
+                if line and not complete:
+                    complete = self._take_event(line, chunks, open_ch, close_ch)
+
+        return "".join(chunks).strip()
+
+    def _failed(self, prompt: str, exc: Exception) -> dict:
+        return {
+            "prompt":       prompt,
+            "raw_response": str(exc),
+            "parsed": {
+                "same_entity": False,
+                "confidence":  0.0,
+                "reason":      "LLM request failed",
+            },
+        }
+
+    def _parse(self, prompt: str, raw_output: str) -> dict:
         try:
             parsed = self._extract_json(raw_output)
             parsed_clean = {
@@ -131,4 +414,165 @@ class AIValidator:
             "prompt":       prompt,
             "raw_response": raw_output,
             "parsed":       parsed_clean,
-        }
\ No newline at end of file
+        }
+
+    # ── Public API ────────────────────────────────────────────────────────────
+
+    def validate(self, name_a: str, name_b: str) -> dict:
+        """
+        Validate whether two names refer to the same entity.
+
+        Pairs that are trivially equal or trivially different after
+        normalisation are answered by a rapidfuzz pre-check ("prompt" is
+        None); only the rest are sent to the LLM.
+
+        Returns
+        -------
+        {
+            "prompt":       str | None,  # None when decided by the pre-check
+            "raw_response": str,
+            "parsed": {
+                "same_entity": bool,
+                "confidence":  float,   # 0.0 – 1.0
+                "reason":      str,
+            }
+        }
+        """
+        # ── Cheap deterministic check first ──────────────────────────────────
+        ruled = self._rule_based(name_a, name_b)
+        if ruled is not None:
+            return ruled
+
+        prompt = self._build_prompt(name_a, name_b)
+
+        # ── Cached answer for this (or the mirrored) pair ───────────────────
+        key = self._cache_key(name_a, name_b)
+        raw_output = self._cache_get(key)
+        if raw_output is not None:
+            return self._parse(prompt, raw_output)
+
+        # ── LLM call ─────────────────────────────────────────────────────────
+        try:
+            raw_output = self._generate_streaming(prompt)
+
+        except Exception as exc:
+            # Failures are not cached so the pair is retried next time
+            return self._failed(prompt, exc)
+
+        self._cache_put(key, raw_output)
+
+        # ── Parse ─────────────────────────────────────────────────────────────
+        return self._parse(prompt, raw_output)
+
+    async def avalidate(
+        self,
+        name_a: str,
+        name_b: str,
+        client: httpx.AsyncClient,
+    ) -> dict:
+        """
+        Async counterpart of validate() on a caller-owned httpx.AsyncClient,
+        so many calls share keep-alive connections on one event loop.
+        Same pre-check, cache and result shape as validate().
+        """
+        ruled = self._rule_based(name_a, name_b)
+        if ruled is not None:
+            return ruled
+
+        prompt = self._build_prompt(name_a, name_b)
+
+        key = self._cache_key(name_a, name_b)
+        raw_output = self._cache_get(key)
+        if raw_output is not None:
+            return self._parse(prompt, raw_output)
+
+        try:
+            raw_output = await self._agenerate_streaming(prompt, client)
+        except Exception as exc:
+            return self._failed(prompt, exc)
+
+        self._cache_put(key, raw_output)
+        return self._parse(prompt, raw_output)
+
+    async def avalidate_batch(
+        self,
+        pairs:  list[tuple[str, str]],
+        client: httpx.AsyncClient,
+    ) -> list[dict]:
+        """
+        Validate several pairs with ONE Ollama request: the uncached pairs
+        are numbered into a single prompt that asks for a JSON array back.
+        Pre-check and cache apply per pair first; any pair the batch reply
+        doesn't answer cleanly is retried through avalidate(). Results keep
+        the input order and have the same shape as validate() ("prompt" is
+        the batch prompt for pairs answered by it).
+        """
+        results: list[dict | None] = [None] * len(pairs)
+        todo = []   # (position, cache key) of pairs that need the LLM
+
+        for i, (name_a, name_b) in enumerate(pairs):
+            ruled = self._rule_based(name_a, name_b)
+            if ruled is not None:
+                results[i] = ruled
+                continue
+            key = self._cache_key(name_a, name_b)
+            raw_output = self._cache_get(key)
+            if raw_output is not None:
+                results[i] = self._parse(self._build_prompt(name_a, name_b), raw_output)
+                continue
+            todo.append((i, key))
+
+        if len(todo) > 1:
+            prompt = self._build_batch_prompt([pairs[i] for i, _ in todo])
+            try:
+                answers = self._split_batch(
+                    await self._agenerate_streaming(prompt, client, n_pairs=len(todo)),
+                    len(todo),
+                )
+            except Exception:
+                answers = {}
+
+            for n, (i, key) in enumerate(todo, 1):
+                if n not in answers:
+                    continue
+                # Cached per pair, so later single or batched calls hit it
+                raw_output = orjson.dumps(answers[n]).decode()
+                self._cache_put(key, raw_output)
+                results[i] = self._parse(prompt, raw_output)
+
+        # Single uncached pair, or pairs the batch reply missed
+        for i, _ in todo:
+            if results[i] is None:
+                results[i] = await self.avalidate(*pairs[i], client)
+
+        return results
+
+    def validate_batch(self, pairs: list[tuple[str, str]]) -> list[dict]:
+        """Synchronous avalidate_batch() on a short-lived AsyncClient."""
+        async def _run() -> list[dict]:
+            async with httpx.AsyncClient(timeout=self.timeout) as client:
+                return await self.avalidate_batch(pairs, client)
+
+        return asyncio.run(_run())
+
+    async def validate_many(self, pairs: list[tuple[str, str]]) -> list[dict]:
+        """
+        Validate many name pairs concurrently; results keep the input order.
+
+        Up to max_concurrency requests are in flight at once, letting the
+        Ollama scheduler overlap them (set OLLAMA_NUM_PARALLEL to match).
+        Each result has the same shape as validate().
+        """
+        sem = asyncio.Semaphore(self.max_concurrency)
+        limits = httpx.Limits(
+            max_connections=self.max_concurrency,
+            max_keepalive_connections=self.max_concurrency,
+        )
+
+        async with httpx.AsyncClient(timeout=self.timeout, limits=limits) as client:
+
+            async def _one(name_a: str, name_b: str) -> dict:
+                async with sem:
+                    return await self.avalidate(name_a, name_b, client)
+
+            return await asyncio.gather(*(_one(a, b) for a, b in pairs))
\ No newline at end of file
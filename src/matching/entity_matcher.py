@@ -2,8 +2,8 @@
 entity_matcher.py
 -----------------
 Matches entities from staging.commoncrawl_clean → staging.abr_clean and:
-  - Writes every confirmed match to core.company_master IMMEDIATELY.
-  - Writes every AI log to core.ai_match_log IMMEDIATELY after each AI call.
+  - Writes confirmed matches to core.company_master in batches of 500.
+  - Writes AI logs to core.ai_match_log in batches of 500 via COPY.
 
 Scoring rules
   >= 85        → auto-approved  (fuzzy only, no AI)
@@ -11,22 +11,41 @@ Scoring rules
   < 78         → rejected
 
 Key optimisations
-  - rapidfuzz with score_cutoff skips sub-threshold candidates in C.
-  - Dual blocking index (3-char prefix + first token) catches word-order variants.
+  - CC rows sharing a blocking key are scored together with one
+    rapidfuzz.process.cdist call (multi-threaded C++, score_cutoff applied).
+  - Dual blocking index (3-char prefix + first token) catches word-order variants;
+    ABR is held as parallel numpy arrays and each index maps key → row indices.
+  - Optional pg_trgm blocking (use_trgm=True): Postgres finds candidates with
+    a GIN trigram index and streams them back; scoring is unchanged.
   - Composite scorer: token_set_ratio + partial_ratio + token_sort_ratio.
-  - Parallel AI calls via ThreadPoolExecutor (default 6 workers, safe on 8GB RAM).
-  - Immediate single-row DB writes — no batching delay.
-  - All regex compiled once at module level.
+  - CC rows sharing a strong_norm are scored (and AI-validated) once; the
+    decision is fanned out to every row with that norm.
+  - Both tables are streamed through server-side cursors in 50k-row chunks;
+    CC chunks are matched as they arrive instead of loading the whole table.
+  - Concurrent AI calls via asyncio + one shared httpx.AsyncClient on a
+    background event loop (default 6 in flight, safe on 8GB RAM); borderline
+    pairs are sent 8 to a prompt, since Ollama largely serialises requests.
+  - Buffered DB writes: one execute_batch / COPY per 500 rows instead of
+    one transaction per row; buffers are flushed at the end of the run.
+  - All regex compiled once at module level; names are normalised once
+    per table with vectorised pandas .str ops.
 """
 
 from __future__ import annotations
 
+import asyncio
 import json
+import logging
+import queue
 import re
+import threading
 import time
 from collections import defaultdict
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from typing import Iterable
 
+import httpx
+import numpy as np
 import pandas as pd
 from rapidfuzz import fuzz, process as rf_process
 from sqlalchemy import text
@@ -34,21 +53,23 @@ from sqlalchemy import text
 from src.db.connection import PostgresConnector
 from src.matching.ai_validator import AIValidator
 
+logger = logging.getLogger(__name__)
+
 
 # ── Module-level compiled patterns ──────────────────────────────────────────
 
+# Alternatives run longest-first, so e.g. "incorporated" is tried before
+# "inc" backtracks out of the trailing \b. No IGNORECASE: callers lower-case
+# first, and case-sensitive matching runs ~2× faster in sre.
 _LEGAL_SUFFIX_RE = re.compile(
     r"\b("
-    r"pty\.?\s*ltd\.?|p\/l|"
-    r"ltd\.?|limited|"
-    r"inc\.?|incorporated|"
-    r"corp\.?|corporation|"
-    r"holdings?|group|trust|"
-    r"services?|solutions?|"
-    r"australia|aust\.?|"
-    r"nsw|vic|qld|wa|sa|tas|act|nt"
-    r")\b",
-    re.IGNORECASE,
+    r"pty\.?\s*ltd\.?|"
+    r"incorporated|corporation|australia|"
+    r"holdings?|solutions?|services?|limited|"
+    r"group|trust|corp\.?|aust\.?|"
+    r"ltd\.?|inc\.?|p/l|"
+    r"nsw|vic|qld|tas|act|wa|sa|nt"
+    r")\b"
 )
 _PUNCT_RE      = re.compile(r"[^\w\s]")
 _WHITESPACE_RE = re.compile(r"\s+")
@@ -60,34 +81,64 @@ SCORE_MED_CONF     = 82   # 82–90  → auto-approve, MEDIUM confidence
 SCORE_AI_MIN       = 78   # 78–81  → send to AI for validation
                            # < 78   → reject outright
 
+# CC rows scored per rapidfuzz.process.cdist call (bounds the score matrix)
+CDIST_CHUNK_ROWS   = 1024
+
+# rapidfuzz silently falls back to pure Python when its C++ extension is
+# missing (or RAPIDFUZZ_IMPLEMENTATION=python); cdist then ignores workers=-1
+# and runs single-threaded without the bit-parallel kernels
+RAPIDFUZZ_CPP      = not rf_process.cdist.__module__.endswith("_py")
+
+# Borderline pairs sent to the LLM in one prompt
+AI_BATCH_SIZE      = 8
+
+# Rows buffered per table before one batched write
+WRITE_BATCH_ROWS   = 500
+
+# Rows per DataFrame when streaming the staging tables (server-side cursor)
+LOAD_CHUNK_ROWS    = 50_000
+
+# pg_trgm similarity() floor for DB-side blocking (use_trgm=True). This only
+# picks candidates — the composite score still decides — so it sits well
+# below the 0.78 scoring cut to keep subset names like "acme" / "acme plumbing".
+TRGM_SIMILARITY_MIN = 0.5
+
 # ── DB SQL ───────────────────────────────────────────────────────────────────
 
-_INSERT_MASTER = text("""
+# Relies on idx_company_master_abn_website_url (UNIQUE) — see sql/schema.sql
+# psycopg2 placeholders: sent with PostgresConnector.execute_batch
+_INSERT_MASTER = """
     INSERT INTO core.company_master
         (abn, website_url, company_name, industry,
          entity_type, entity_status, state, postcode,
          match_method, match_confidence)
-    SELECT
-        :abn, :website_url, :company_name, :industry,
-        :entity_type, :entity_status, :state, :postcode,
-        :match_method, :match_confidence
-    WHERE NOT EXISTS (
-        SELECT 1 FROM core.company_master
-        WHERE abn = :abn AND website_url = :website_url
-    )
-""")
-
-_INSERT_AI_LOG = text("""
-    INSERT INTO core.ai_match_log
-        (company_a, company_b, fuzzy_score,
-         prompt, llm_response,
-         decision)
     VALUES
-        (:company_a, :company_b, :fuzzy_score,
-         :prompt, CAST(:llm_response AS jsonb),
-         :decision)
+        (%(abn)s, %(website_url)s, %(company_name)s, %(industry)s,
+         %(entity_type)s, %(entity_status)s, %(state)s, %(postcode)s,
+         %(match_method)s, %(match_confidence)s)
+    ON CONFLICT (abn, website_url) DO NOTHING
+"""
+
+# Candidate ABNs per CC row in one chunk; the % join is served by idx_abr_clean_normalized_name_trgm
+_TRGM_CANDIDATES = text("""
+    SELECT cc.id, array_agg(abr.abn) AS abns
+    FROM staging.commoncrawl_clean cc
+    JOIN staging.abr_clean abr
+      ON cc.normalized_name % abr.normalized_name
+    WHERE cc.id = ANY(:ids)
+    GROUP BY cc.id
 """)
 
+# core.ai_match_log is append-only, so it is loaded with COPY
+_AI_LOG_COLUMNS = [
+    "company_a", "company_b", "fuzzy_score",
+    "prompt", "llm_response",
+    "decision",
+]
+
+
+# Candidate set for CC rows that have no blocking-key hits
+_NO_CANDIDATES = np.empty(0, dtype=np.int64)
 
 # ── Helpers ──────────────────────────────────────────────────────────────────
 
@@ -105,18 +156,100 @@ def strong_normalize(name: str) -> str:
     return name
 
 
-def composite_score(norm_a: str, norm_b: str) -> float:
+def _normalize_series(names: pd.Series) -> pd.Series:
+    """
+    Vectorised strong_normalize over a whole column: each step is one
+    pandas .str pass in C instead of three regex calls per row in Python.
+    """
+    return (
+        names.fillna("")
+        .str.lower()
+        .str.replace(_LEGAL_SUFFIX_RE, "", regex=True)
+        .str.replace(_PUNCT_RE, " ", regex=True)
+        .str.replace(_WHITESPACE_RE, " ", regex=True)
+        .str.strip()
+    )
+
+
+def _sort_tokens(norm: str) -> str:
+    """token_sort_ratio's preprocessing, done once: tokens sorted and re-joined."""
+    return " ".join(sorted(norm.split()))
+
+
+def _sort_tokens_series(norms: pd.Series) -> pd.Series:
+    """Vectorised _sort_tokens over a strong_norm column."""
+    return norms.str.split().map(sorted).str.join(" ")
+
+
+def composite_score(norm_a: str, norm_b: str, tsr_known: float | None = None) -> float:
     """
     Best of three rapidfuzz scorers (all run in C, very fast):
       token_set_ratio  – handles word-order differences & subset names
       partial_ratio    – handles one name being contained in the other
       token_sort_ratio – handles pure word-order shuffles
+
+    Pass tsr_known when token_set_ratio is already computed (e.g. by cdist).
+    Stops as soon as a scorer clears SCORE_HIGH_CONF — the pair is
+    auto-approved either way, so the remaining scorers can't change the route.
     """
-    return max(
-        fuzz.token_set_ratio(norm_a, norm_b),
-        fuzz.partial_ratio(norm_a, norm_b),
-        fuzz.token_sort_ratio(norm_a, norm_b),
-    )
+    best = fuzz.token_set_ratio(norm_a, norm_b) if tsr_known is None else tsr_known
+    if best > SCORE_HIGH_CONF:
+        return best
+
+    best = max(best, fuzz.partial_ratio(norm_a, norm_b))
+    if best > SCORE_HIGH_CONF:
+        return best
+
+    return max(best, fuzz.token_sort_ratio(norm_a, norm_b))
+
+
+def composite_scores(
+    norms_a: list[str],
+    norms_b: list[str],
+    tsr_known: np.ndarray,
+    sorted_b: list[str] | None = None,
+) -> np.ndarray:
+    """
+    composite_score over aligned pairs (norms_a[i], norms_b[i]) with the same
+    short-circuit, but each scorer is one rapidfuzz.process.cpdist call
+    (multi-threaded C++) over the pairs still at or below SCORE_HIGH_CONF,
+    instead of one Python-level call per pair.
+
+    sorted_b, if given, holds _sort_tokens(norms_b[i]) precomputed (e.g.
+    abr_sorted_norm); token_sort_ratio is then plain fuzz.ratio on sorted
+    strings, so neither side is re-tokenised per pair.
+    """
+    best = np.asarray(tsr_known, dtype=np.float32).copy()
+
+    todo = np.flatnonzero(best <= SCORE_HIGH_CONF)
+    if not len(todo):
+        return best
+    # A score below every pair's current best can't raise any max, so
+    # rapidfuzz may abandon those pairs early (they come back as 0)
+    best[todo] = np.maximum(best[todo], rf_process.cpdist(
+        [norms_a[i] for i in todo],
+        [norms_b[i] for i in todo],
+        scorer=fuzz.partial_ratio,
+        score_cutoff=float(best[todo].min()),
+        dtype=np.float32,
+        workers=-1,
+    ))
+
+    todo = np.flatnonzero(best <= SCORE_HIGH_CONF)
+    if not len(todo):
+        return best
+    if sorted_b is None:
+        sorted_b = [_sort_tokens(n) for n in norms_b]
+    best[todo] = np.maximum(best[todo], rf_process.cpdist(
+        [_sort_tokens(norms_a[i]) for i in todo],
+        [sorted_b[i] for i in todo],
+        scorer=fuzz.ratio,
+        processor=None,
+        score_cutoff=float(best[todo].min()),
+        dtype=np.float32,
+        workers=-1,
+    ))
+    return best
 
 
 # ── Main class ───────────────────────────────────────────────────────────────
@@ -126,9 +259,18 @@ class EntityMatcher:
     Parameters
     ----------
     db_password  : PostgreSQL password for PostgresConnector.
-    ai_workers   : Parallel threads for AI validation (default 6, safe on 8 GB RAM).
+    ai_workers   : Concurrent AI validation requests (default 6, safe on 8 GB RAM).
                    Do not exceed 8 on an 8 GB machine — risk of swap thrashing.
-    debug        : Print per-record decisions to stdout.
+                   Start Ollama with OLLAMA_NUM_PARALLEL=<ai_workers> so it
+                   actually serves that many requests in parallel.
+    debug        : Log per-record decisions at DEBUG. Only this instance logs
+                   them, and only while the module logger is enabled for DEBUG
+                   (the level is left to the application, as in the CLI).
+    ai_batch     : Borderline pairs per Ollama request (default 8; 1 sends
+                   each pair on its own).
+    use_trgm     : Let Postgres pick candidates with pg_trgm instead of the
+                   in-memory prefix/token indexes (needs the trigram index
+                   from sql/schema.sql).
     """
 
     def __init__(
@@ -136,324 +278,569 @@ class EntityMatcher:
         db_password: str,
         ai_workers:  int  = 6,     # ← safe sweet spot for 8 GB RAM
         debug:       bool = False,
+        use_trgm:    bool = False,
+        ai_batch:    int  = AI_BATCH_SIZE,
     ):
         self.db           = PostgresConnector(password=db_password)
         self.ai_workers   = ai_workers
+        self.ai_batch     = ai_batch
         self.debug        = debug
+        self.use_trgm     = use_trgm
         self.ai_validator = AIValidator()
 
-    # ── Data loading ──────────────────────────────────────────────────────────
+        # Write buffers; AI logs arrive from worker threads, hence the lock
+        self._match_buffer:   list[dict] = []
+        self._ai_buffer:      list[dict] = []
+        self._ai_buffer_lock = threading.Lock()
 
-    def load_data(self) -> tuple[pd.DataFrame, pd.DataFrame]:
-        cc_df = pd.read_sql("""
-            SELECT website_url, company_name, normalized_name
-            FROM staging.commoncrawl_clean
-            WHERE normalized_name IS NOT NULL
-        """, self.db.engine)
+    # ── Data loading ──────────────────────────────────────────────────────────
 
-        abr_df = pd.read_sql("""
+    def _read_chunks(self, query: str):
+        """
+        Stream a query through a server-side cursor as DataFrames of
+        LOAD_CHUNK_ROWS rows, adding strong_norm to each chunk.
+        """
+        with self.db.engine.connect().execution_options(
+            stream_results=True, yield_per=LOAD_CHUNK_ROWS
+        ) as conn:
+            for chunk in pd.read_sql(text(query), conn, chunksize=LOAD_CHUNK_ROWS):
+                # Normalise once per chunk, not once per row inside the loops;
+                # normalized_name isn't needed afterwards, so don't keep it
+                chunk["strong_norm"] = _normalize_series(chunk["normalized_name"])
+                yield chunk.drop(columns="normalized_name")
+
+    def load_abr(self) -> pd.DataFrame:
+        """ABR is needed whole for the blocking indexes; it is read in chunks."""
+        abr_df = pd.concat(list(self._read_chunks("""
             SELECT abn, entity_name, normalized_name,
                    entity_type, entity_status, state, postcode
             FROM staging.abr_clean
             WHERE normalized_name IS NOT NULL
-        """, self.db.engine)
-
-        print(f"Common Crawl records : {len(cc_df):,}")
+        """)), ignore_index=True)
         print(f"ABR records          : {len(abr_df):,}")
-        return cc_df, abr_df
+        return abr_df
+
+    def count_cc(self) -> int:
+        with self.db.engine.connect() as conn:
+            return conn.execute(text("""
+                SELECT count(*) FROM staging.commoncrawl_clean
+                WHERE normalized_name IS NOT NULL
+            """)).scalar_one()
+
+    def iter_cc(self):
+        """Yield staging.commoncrawl_clean in LOAD_CHUNK_ROWS-row DataFrames."""
+        return self._read_chunks("""
+            SELECT id, website_url, company_name, normalized_name
+            FROM staging.commoncrawl_clean
+            WHERE normalized_name IS NOT NULL
+        """)
 
     # ── Blocking index ────────────────────────────────────────────────────────
 
-    def build_indexes(self, abr_df: pd.DataFrame) -> tuple[dict, dict, dict, dict]:
+    def build_indexes(self, abr_df: pd.DataFrame) -> tuple[dict, dict]:
         """
-        Build two blocking indexes for fast candidate retrieval:
+        Store ABR as parallel numpy arrays on self (abr_abn, abr_entity_name,
+        …, abr_strong_norm, abr_sorted_norm — row i of each array is one
+        entity) and build two blocking indexes for fast candidate retrieval:
           by_prefix3  – keyed on first 3 chars of strong_norm
           by_token1   – keyed on first whitespace token of strong_norm
-        Both map key → list[namedtuple row] and key → list[str norm].
+        Both map key → int64 array of row indices into those arrays.
         """
-        abr_df = abr_df.copy()
-        abr_df["strong_norm"] = abr_df["normalized_name"].apply(strong_normalize)
-
-        by_prefix3 = defaultdict(list)
-        by_token1  = defaultdict(list)
-
-        for row in abr_df.itertuples(index=False):
-            sn = row.strong_norm
-            if not sn:
-                continue
-            by_prefix3[sn[:3]].append(row)
-            first_tok = sn.split()[0] if sn.split() else sn
-            by_token1[first_tok].append(row)
-
-        def _names(d):
-            return {k: [r.strong_norm for r in v] for k, v in d.items()}
-
-        return by_prefix3, _names(by_prefix3), by_token1, _names(by_token1)
-
-    # ── Immediate DB writes ───────────────────────────────────────────────────
+        if "strong_norm" not in abr_df.columns:
+            abr_df = abr_df.copy()
+            abr_df["strong_norm"] = _normalize_series(abr_df["normalized_name"])
+
+        # Rows with an empty norm can never be a candidate
+        abr_df = abr_df[abr_df["strong_norm"] != ""].reset_index(drop=True)
+        sn     = abr_df["strong_norm"]
+
+        self.abr_abn           = abr_df["abn"].to_numpy()
+        self.abr_entity_name   = abr_df["entity_name"].to_numpy()
+        self.abr_entity_type   = abr_df["entity_type"].to_numpy()
+        self.abr_entity_status = abr_df["entity_status"].to_numpy()
+        self.abr_state         = abr_df["state"].to_numpy()
+        self.abr_postcode      = abr_df["postcode"].to_numpy()
+        self.abr_strong_norm   = sn.to_numpy()
+        # Token-sorted once here, not once per pair inside token_sort_ratio
+        self.abr_sorted_norm   = _sort_tokens_series(sn).to_numpy()
+
+        # groupby(...).indices is exactly {key: ndarray[int64] of positions}
+        by_prefix3 = sn.groupby(sn.str[:3]).indices
+        # strong_norm is stripped with single spaces, so the text before the
+        # first " " is the first token — one scan, no token list
+        by_token1  = sn.groupby(sn.str.partition(" ")[0]).indices
+
+        return by_prefix3, by_token1
+
+    def _log_records(self) -> bool:
+        """True when this instance should log per-record decisions."""
+        return self.debug and logger.isEnabledFor(logging.DEBUG)
+
+    # ── Buffered DB writes ────────────────────────────────────────────────────
 
     def _write_match(self, record: dict) -> None:
-        """Write a single confirmed match to core.company_master immediately."""
-        with self.db.engine.begin() as conn:
-            conn.execute(_INSERT_MASTER, record)
-        if self.debug:
-            print(f"  [DB MATCH] {record['company_name']} | "
-                  f"abn={record['abn']} | "
-                  f"method={record['match_method']} | "
-                  f"conf={record['match_confidence']:.1f}")
+        """Buffer a confirmed match; flushes every WRITE_BATCH_ROWS rows."""
+        self._match_buffer.append(record)
+        if self._log_records():
+            logger.debug("  [DB MATCH] %s | abn=%s | method=%s | conf=%.1f",
+                         record["company_name"], record["abn"],
+                         record["match_method"], record["match_confidence"])
+        if len(self._match_buffer) >= WRITE_BATCH_ROWS:
+            self._flush_matches()
+
+    def _flush_matches(self) -> None:
+        """Insert buffered matches in one execute_batch round-trip and transaction."""
+        if not self._match_buffer:
+            return
+        batch, self._match_buffer = self._match_buffer, []
+        self.db.execute_batch(_INSERT_MASTER, batch, page_size=WRITE_BATCH_ROWS)
 
     def _write_ai_log(self, log: dict) -> None:
-        """Write a single AI validation event to core.ai_match_log immediately."""
-        with self.db.engine.begin() as conn:
-            conn.execute(_INSERT_AI_LOG, log)
-        if self.debug:
-            print(f"  [DB AI LOG] {log['company_a']!r} / {log['company_b']!r} | "
-                  f"fuzzy={log['fuzzy_score']} | "
-                  f"approved={log['decision']}")
+        """Buffer an AI validation event; flushes every WRITE_BATCH_ROWS rows."""
+        with self._ai_buffer_lock:
+            self._ai_buffer.append(log)
+            full = len(self._ai_buffer) >= WRITE_BATCH_ROWS
+        if self._log_records():
+            logger.debug("  [DB AI LOG] %r / %r | fuzzy=%s | approved=%s",
+                         log["company_a"], log["company_b"],
+                         log["fuzzy_score"], log["decision"])
+        if full:
+            self._flush_ai_logs()
+
+    def _flush_ai_logs(self) -> None:
+        """COPY buffered AI logs into core.ai_match_log."""
+        with self._ai_buffer_lock:
+            batch, self._ai_buffer = self._ai_buffer, []
+        if not batch:
+            return
+        self.db.copy_records(
+            ([log[col] for col in _AI_LOG_COLUMNS] for log in batch),
+            _AI_LOG_COLUMNS, "ai_match_log", "core",
+        )
 
     # ── Candidate lookup ──────────────────────────────────────────────────────
 
     def _get_candidates(
         self,
-        cc_norm:       str,
-        by_prefix3:    dict,
-        names_prefix3: dict,
-        by_token1:     dict,
-        names_token1:  dict,
-    ) -> tuple[list, list]:
+        cc_norm:    str,
+        by_prefix3: dict,
+        by_token1:  dict,
+    ) -> np.ndarray:
         """
-        Merge candidates from both blocking indexes, deduplicating by abn.
-        Returns (candidate_rows, candidate_norms).
+        Merge candidates from both blocking indexes. ABN is the primary
+        key of staging.abr_clean, so de-duplicating row indices also
+        de-duplicates by abn. Returns a sorted int64 array of ABR rows.
         """
         key3   = cc_norm[:3]
-        tokens = cc_norm.split()
-        keytok = tokens[0] if tokens else cc_norm
+        keytok = cc_norm.partition(" ")[0] or cc_norm
 
-        seen_abns = set()
-        rows, norms = [], []
+        return np.union1d(
+            by_prefix3.get(key3,   _NO_CANDIDATES),
+            by_token1.get(keytok, _NO_CANDIDATES),
+        )
 
-        for bucket_rows, bucket_norms in (
-            (by_prefix3.get(key3, []),  names_prefix3.get(key3, [])),
-            (by_token1.get(keytok, []), names_token1.get(keytok, [])),
-        ):
-            for row, norm in zip(bucket_rows, bucket_norms):
-                if row.abn not in seen_abns:
-                    seen_abns.add(row.abn)
-                    rows.append(row)
-                    norms.append(norm)
+    def _iter_blocks(self, cc_chunks, by_prefix3: dict, by_token1: dict):
+        """
+        Yield (norms, rows, candidates) blocks over CC DataFrame chunks:
+          norms       – distinct strong_norms that share one candidate set
+          rows        – per norm, every CC row (namedtuple) with that norm
+          candidates  – int64 ABR row indices (empty → nothing to score)
+        Rows sharing a strong_norm get identical candidates and scores, so
+        each norm is scored once and its decision fans out to its rows.
+        """
+        abr_pos = {abn: i for i, abn in enumerate(self.abr_abn)} if self.use_trgm else None
 
-        return rows, norms
+        for cc_df in cc_chunks:
+            if "strong_norm" not in cc_df.columns:
+                cc_df = cc_df.copy()
+                cc_df["strong_norm"] = _normalize_series(cc_df["normalized_name"])
+
+            cc_rows      = list(cc_df.itertuples(index=False))
+            rows_by_norm = {
+                norm: [cc_rows[p] for p in positions]
+                for norm, positions in cc_df.groupby("strong_norm", sort=False).indices.items()
+            }
 
-    # ── Single AI validation job (runs in thread pool) ────────────────────────
+            # Rows with an empty norm can never match
+            if "" in rows_by_norm:
+                yield [""], [rows_by_norm.pop("")], _NO_CANDIDATES
 
-    def _run_ai_job(
+            if self.use_trgm:
+                yield from self._trgm_blocks(rows_by_norm, abr_pos)
+                continue
+
+            # Every norm with the same (prefix3, token1) pair sees the same
+            # candidate set, so the whole group is scored with one cdist call
+            cc_groups: dict[tuple[str, str], list[str]] = defaultdict(list)
+            for cc_norm in rows_by_norm:
+                cc_groups[(cc_norm[:3], cc_norm.partition(" ")[0] or cc_norm)].append(cc_norm)
+
+            for norms in cc_groups.values():
+                yield (
+                    norms,
+                    [rows_by_norm[n] for n in norms],
+                    self._get_candidates(norms[0], by_prefix3, by_token1),
+                )
+
+    def _trgm_blocks(self, rows_by_norm: dict, abr_pos: dict):
+        """
+        Same blocks as _iter_blocks, one norm each, with candidates found by
+        Postgres: a pg_trgm % join over normalized_name for the first row of
+        each norm in this chunk, streamed through a server-side cursor.
+        Norms without candidates are yielded last so they count as processed.
+        """
+        norm_by_id = {int(rows[0].id): norm for norm, rows in rows_by_norm.items()}
+        leftover   = set(rows_by_norm)
+
+        with self.db.engine.connect() as conn:
+            # is_local=true: the threshold lasts only for this connection's
+            # (autobegun) transaction, which also runs the candidate query,
+            # so the pooled connection goes back with the default setting
+            conn.execute(
+                text("SELECT set_config('pg_trgm.similarity_threshold', :t, true)"),
+                {"t": str(TRGM_SIMILARITY_MIN)},
+            )
+            result = conn.execution_options(stream_results=True).execute(
+                _TRGM_CANDIDATES, {"ids": list(norm_by_id)}
+            )
+            for part in result.partitions(5000):
+                for cc_id, abns in part:
+                    norm = norm_by_id[cc_id]
+                    idx  = [abr_pos[a] for a in abns if a in abr_pos]
+                    if idx:
+                        leftover.discard(norm)
+                        yield [norm], [rows_by_norm[norm]], np.unique(np.array(idx, dtype=np.int64))
+
+        if leftover:
+            norms = list(leftover)
+            yield norms, [rows_by_norm[n] for n in norms], _NO_CANDIDATES
+
+    # ── Background event loop for AI calls ───────────────────────────────────
+
+    @contextmanager
+    def _ai_event_loop(self):
+        """
+        Run an asyncio loop on a background thread with one shared
+        httpx.AsyncClient (keep-alive pool sized to ai_workers) and an
+        asyncio.Semaphore capping in-flight requests.
+
+        Yields submit([(cc_name, abr_name, fuzzy_score), ...]) → concurrent
+        Future, so the synchronous matching loop can keep scoring while AI
+        calls are in flight.
+        """
+        loop   = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+
+        async def _open():
+            limits = httpx.Limits(
+                max_connections=self.ai_workers,
+                max_keepalive_connections=self.ai_workers,
+            )
+            return httpx.AsyncClient(limits=limits), asyncio.Semaphore(self.ai_workers)
+
+        client, sem = asyncio.run_coroutine_threadsafe(_open(), loop).result()
+
+        def submit(items: list[tuple[str, str, float]]):
+            return asyncio.run_coroutine_threadsafe(
+                self._run_ai_batch(items, client, sem), loop
+            )
+
+        try:
+            yield submit
+        finally:
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+
+    # ── Batched AI validation job (runs on the event loop) ───────────────────
+
+    async def _run_ai_batch(
         self,
-        cc_name:     str,
-        abr_name:    str,
-        fuzzy_score: float,
-    ) -> tuple[bool, float]:
+        items:  list[tuple[str, str, float]],
+        client: httpx.AsyncClient,
+        sem:    asyncio.Semaphore,
+    ) -> list[tuple[bool, float]]:
         """
-        Call AIValidator, write the log immediately, return (approved, confidence).
-        Runs inside a ThreadPoolExecutor worker thread.
+        Validate (cc_name, abr_name, fuzzy_score) items with one batched
+        AIValidator call, buffer one log per item, return
+        [(approved, confidence), ...] in item order. Runs as a task on the
+        background event loop; at most ai_workers requests are in flight.
         """
-        ai_result = self.ai_validator.validate(cc_name, abr_name)
-        parsed    = ai_result["parsed"]
-        approved  = bool(parsed["same_entity"])
-
-        self._write_ai_log({
-            "company_a":    cc_name,
-            "company_b":    abr_name,
-            "fuzzy_score":  fuzzy_score,
-            "prompt":       ai_result["prompt"],
-            "llm_response": json.dumps({
-                "raw":    ai_result["raw_response"],
-                "parsed": parsed,
-            }),
-            "decision":     approved,
-        })
-
-        return approved, float(parsed["confidence"])
+        async with sem:
+            ai_results = await self.ai_validator.avalidate_batch(
+                [(cc_name, abr_name) for cc_name, abr_name, _ in items], client
+            )
+
+        decisions, logs = [], []
+        for (cc_name, abr_name, fuzzy_score), ai_result in zip(items, ai_results):
+            parsed   = ai_result["parsed"]
+            approved = bool(parsed["same_entity"])
+            decisions.append((approved, float(parsed["confidence"])))
+            logs.append({
+                "company_a":    cc_name,
+                "company_b":    abr_name,
+                "fuzzy_score":  fuzzy_score,
+                "prompt":       ai_result["prompt"],
+                "llm_response": json.dumps({
+                    "raw":    ai_result["raw_response"],
+                    "parsed": parsed,
+                }),
+                "decision":     approved,
+            })
+
+        # Blocking DB writes go to a worker thread so the loop keeps going
+        def _write_logs() -> None:
+            for log in logs:
+                self._write_ai_log(log)
+
+        await asyncio.to_thread(_write_logs)
+        return decisions
 
     # ── Core matching loop ────────────────────────────────────────────────────
 
-    def fuzzy_match(self, cc_df: pd.DataFrame, abr_df: pd.DataFrame) -> None:
+    def fuzzy_match(
+        self,
+        cc_df:         pd.DataFrame | Iterable[pd.DataFrame],
+        abr_df:        pd.DataFrame,
+        total_records: int | None = None,
+    ) -> None:
+        """
+        Match CC rows against ABR. cc_df may be one DataFrame or an iterable
+        of DataFrame chunks (see iter_cc); total_records is only used for
+        progress / ETA when chunks are streamed.
+        """
+        if isinstance(cc_df, pd.DataFrame):
+            cc_chunks, total_records = [cc_df], len(cc_df)
+        else:
+            cc_chunks = cc_df
+
+        if not RAPIDFUZZ_CPP:
+            print("WARNING: rapidfuzz is running its pure-Python fallback — "
+                  "reinstall RapidFuzz wheels; matching will be far slower.")
 
         print("\nBuilding blocking indexes …")
-        by_prefix3, names_prefix3, by_token1, names_token1 = self.build_indexes(abr_df)
+        by_prefix3, by_token1 = self.build_indexes(abr_df)
         print("Indexes ready. Starting matching …\n")
 
         start          = time.perf_counter()
-        total_records  = len(cc_df)          # known upfront for ETA
+        total_records  = total_records or 0  # known upfront for ETA
         total_proc     = 0
         total_written  = 0
         total_ai       = 0
         total_rejected = 0
         total_high     = 0
         total_med      = 0
+        log_records    = self._log_records()
 
         # ── Helper closures ───────────────────────────────────────────────────
 
-        def _build_record(cc_row, abr_row, method: str, confidence: float) -> dict:
+        def _build_record(cc_row, abr_i: int, method: str, confidence: float) -> dict:
             # Truncate to column limits and coerce None-safe strings
             # state: VARCHAR(3), postcode: VARCHAR(4), match_method: VARCHAR(20)
-            raw_state    = str(abr_row.state    or "").strip()
-            raw_postcode = str(abr_row.postcode or "").strip()
-            raw_method   = str(method or "").strip()
+            state    = str(self.abr_state[abr_i] or "").strip()[:3] or None
+            method_  = str(method or "").strip()[:20] or method
+            postcode = str(self.abr_postcode[abr_i] or "").strip()
 
-            # Only keep postcode if it looks like a valid AU postcode (4 digits)
-            postcode = raw_postcode if re.fullmatch(r"\d{4}", raw_postcode) else None
-            state    = raw_state[:3]   if raw_state    else None
-            method_  = raw_method[:20] if raw_method   else method
+            # Only keep postcode if it looks like a valid AU postcode (4 digits);
+            # isdecimal() accepts exactly what the regex \d did
+            if not (len(postcode) == 4 and postcode.isdecimal()):
+                postcode = None
 
             return {
-                "abn":              abr_row.abn,
+                "abn":              self.abr_abn[abr_i],
                 "website_url":      cc_row.website_url,
-                "company_name":     abr_row.entity_name,
+                "company_name":     self.abr_entity_name[abr_i],
                 "industry":         None,
-                "entity_type":      abr_row.entity_type,
-                "entity_status":    abr_row.entity_status,
+                "entity_type":      self.abr_entity_type[abr_i],
+                "entity_status":    self.abr_entity_status[abr_i],
                 "state":            state,
                 "postcode":         postcode,
                 "match_method":     method_,
                 "match_confidence": round(float(confidence), 2),
             }
 
-        def _drain_futures(pending: dict, total_written: int) -> int:
-            """Collect any completed AI futures and write approved matches."""
-            done = [f for f in list(pending) if f.done()]
-            for fut in done:
-                cc_row, abr_row, _ = pending.pop(fut)
+        def _drain_futures(pending: dict, done_q: queue.SimpleQueue,
+                           total_written: int, block: bool = False) -> int:
+            """
+            Write approved matches for AI futures that have completed.
+            Futures push themselves onto done_q when they finish, so this
+            costs O(completed) rather than a scan over every pending future.
+            With block=True, waits until nothing is pending.
+            """
+            while pending:
                 try:
-                    approved, confidence = fut.result()
+                    fut = done_q.get() if block else done_q.get_nowait()
+                except queue.Empty:
+                    break
+                batch = pending.pop(fut)
+                try:
+                    decisions = fut.result()
                 except Exception as exc:
                     print(f"  [AI ERROR] {exc}")
                     continue
-                if approved:
-                    self._write_match(_build_record(
-                        cc_row, abr_row, "ai_validated", confidence * 100
-                    ))
-                    total_written += 1
+                for (fan_out, abr_i), (approved, confidence) in zip(batch, decisions):
+                    if not approved:
+                        continue
+                    for cc_row in fan_out:
+                        self._write_match(_build_record(
+                            cc_row, abr_i, "ai_validated", confidence * 100
+                        ))
+                    total_written += len(fan_out)
             return total_written
 
-        # ── Main loop ─────────────────────────────────────────────────────────
-
-        pending_futures: dict = {}   # future → (cc_row, abr_row, fuzzy_score)
+        def _report_progress() -> None:
+            elapsed      = time.perf_counter() - start
+            remaining    = total_records - total_proc
+            rate         = total_proc / elapsed if elapsed > 0 else 0
+            eta_secs     = (remaining / rate) if rate > 0 else 0
+            eta_mins     = eta_secs / 60
+            pct          = (total_proc / total_records * 100) if total_records > 0 else 0
+            print(
+                f"  [{pct:5.1f}%] "
+                f"Processed={total_proc:,}/{total_records:,}  "
+                f"Remaining={remaining:,}  "
+                f"Written={total_written:,}  "
+                f"AI calls={total_ai:,}  "
+                f"Rejected={total_rejected:,}  "
+                f"Elapsed={elapsed:.1f}s  "
+                f"ETA={eta_mins:.1f}m"
+            )
 
-        with ThreadPoolExecutor(max_workers=self.ai_workers) as executor:
+        # ── Main loop ─────────────────────────────────────────────────────────
 
-            for cc_row in cc_df.itertuples(index=False):
-                total_proc += 1
+        pending_futures: dict = {}   # future → [(fan_out cc_rows, abr_i), ...]
+        done_futures = queue.SimpleQueue()   # completed futures, in finish order
+        ai_items: list[tuple[str, str, float]] = []   # next batch for submit_ai
+        ai_meta:  list[tuple[list, int]]       = []   # (fan_out, abr_i) per item
 
-                cc_norm = strong_normalize(cc_row.normalized_name)
-                if not cc_norm:
-                    continue
-
-                # Candidate retrieval via dual index
-                candidates, candidate_norms = self._get_candidates(
-                    cc_norm,
-                    by_prefix3, names_prefix3,
-                    by_token1,  names_token1,
-                )
-                if not candidates:
-                    continue
+        with self._ai_event_loop() as submit_ai:
 
-                # Fast pre-filter — score_cutoff skips sub-77 pairs in C
-                best = rf_process.extractOne(
-                    cc_norm,
-                    candidate_norms,
-                    scorer=fuzz.token_set_ratio,
-                    score_cutoff=SCORE_AI_MIN - 1,   # skip anything below 77
-                )
-                if not best:
-                    total_rejected += 1
+            for block_norms, block_rows, candidates in self._iter_blocks(
+                cc_chunks, by_prefix3, by_token1
+            ):
+                if not len(candidates):
+                    total_proc += sum(len(rows) for rows in block_rows)
                     continue
-
-                _, _, idx = best
-                abr_row  = candidates[idx]
-                abr_norm = abr_row.strong_norm
-
-                # Composite rescore for final decision
-                score = composite_score(cc_norm, abr_norm)
-
-                # ── Decision tree ─────────────────────────────────────────────
-
-                if score > SCORE_HIGH_CONF:
-                    # > 90 — HIGH confidence auto-approve
-                    if self.debug:
-                        print(f"[HIGH] {cc_row.company_name!r} → "
-                              f"{abr_row.entity_name!r} | score={score:.0f}")
-                    self._write_match(_build_record(
-                        cc_row, abr_row, "fuzzy_high_conf", score
-                    ))
-                    total_written += 1
-                    total_high    += 1
-
-                elif score >= SCORE_MED_CONF:
-                    # 82–90 — MEDIUM confidence auto-approve
-                    if self.debug:
-                        print(f"[MED]  {cc_row.company_name!r} → "
-                              f"{abr_row.entity_name!r} | score={score:.0f}")
-                    self._write_match(_build_record(
-                        cc_row, abr_row, "fuzzy_med_conf", score
-                    ))
-                    total_written += 1
-                    total_med     += 1
-
-                elif score >= SCORE_AI_MIN:
-                    # 78–81 — borderline, send to AI
-                    total_ai += 1
-                    if self.debug:
-                        print(f"[AI]   {cc_row.company_name!r} → "
-                              f"{abr_row.entity_name!r} | fuzzy={score:.0f}")
-                    fut = executor.submit(
-                        self._run_ai_job,
-                        cc_row.company_name,
-                        abr_row.entity_name,
-                        float(score),
+                candidate_norms = self.abr_strong_norm[candidates]
+
+                for chunk_start in range(0, len(block_norms), CDIST_CHUNK_ROWS):
+                    chunk_norms = block_norms[chunk_start:chunk_start + CDIST_CHUNK_ROWS]
+                    fan_outs    = block_rows[chunk_start:chunk_start + CDIST_CHUNK_ROWS]
+                    row_counts  = np.array([len(f) for f in fan_outs])
+                    proc_before = total_proc
+
+                    # One multi-threaded C++ scan scores chunk × candidates;
+                    # entries below score_cutoff come back as 0
+                    scores = rf_process.cdist(
+                        chunk_norms,
+                        candidate_norms,
+                        scorer=fuzz.token_set_ratio,
+                        score_cutoff=SCORE_AI_MIN - 1,   # skip anything below 77
+                        dtype=np.float32,
+                        workers=-1,
+                    )
+                    best_idx   = scores.argmax(axis=1)
+                    best_score = scores[np.arange(len(chunk_norms)), best_idx]
+
+                    survivors = np.flatnonzero(best_score >= SCORE_AI_MIN - 1)
+                    total_rejected += int(row_counts.sum() - row_counts[survivors].sum())
+
+                    # Composite rescore only for pairs that passed the cut,
+                    # reusing the token_set_ratio cdist already computed
+                    composite = composite_scores(
+                        [chunk_norms[i] for i in survivors],
+                        candidate_norms[best_idx[survivors]],
+                        best_score[survivors],
+                        self.abr_sorted_norm[candidates[best_idx[survivors]]],
                     )
-                    pending_futures[fut] = (cc_row, abr_row, score)
 
-                else:
+                    high_mask = composite > SCORE_HIGH_CONF
+                    med_mask  = ~high_mask & (composite >= SCORE_MED_CONF)
+                    ai_mask   = ~high_mask & ~med_mask & (composite >= SCORE_AI_MIN)
                     # < 78 — reject
-                    total_rejected += 1
-
-                # Drain completed AI futures so memory stays bounded
-                if len(pending_futures) >= self.ai_workers * 2:
-                    total_written = _drain_futures(pending_futures, total_written)
-
-                # Progress report every 1,000 rows
-                if total_proc % 1000 == 0:
-                    elapsed      = time.perf_counter() - start
-                    remaining    = total_records - total_proc
-                    rate         = total_proc / elapsed if elapsed > 0 else 0
-                    eta_secs     = (remaining / rate) if rate > 0 else 0
-                    eta_mins     = eta_secs / 60
-                    pct          = (total_proc / total_records * 100) if total_records > 0 else 0
-                    print(
-                        f"  [{pct:5.1f}%] "
-                        f"Processed={total_proc:,}/{total_records:,}  "
-                        f"Remaining={remaining:,}  "
-                        f"Written={total_written:,}  "
-                        f"AI calls={total_ai:,}  "
-                        f"Rejected={total_rejected:,}  "
-                        f"Elapsed={elapsed:.1f}s  "
-                        f"ETA={eta_mins:.1f}m"
-                    )
+                    total_rejected += int(row_counts[survivors[composite < SCORE_AI_MIN]].sum())
+
+                    # ── Decision tree ─────────────────────────────────────────
+
+                    for i, score in zip(survivors[high_mask], composite[high_mask]):
+                        # > 90 — HIGH confidence auto-approve
+                        abr_i   = candidates[best_idx[i]]
+                        if log_records:
+                            logger.debug("[HIGH] %r → %r | score=%.0f",
+                                         fan_outs[i][0].company_name,
+                                         self.abr_entity_name[abr_i], score)
+                        for cc_row in fan_outs[i]:
+                            self._write_match(_build_record(
+                                cc_row, abr_i, "fuzzy_high_conf", score
+                            ))
+                        total_written += len(fan_outs[i])
+                        total_high    += len(fan_outs[i])
+
+                    for i, score in zip(survivors[med_mask], composite[med_mask]):
+                        # 82–90 — MEDIUM confidence auto-approve
+                        abr_i   = candidates[best_idx[i]]
+                        if log_records:
+                            logger.debug("[MED]  %r → %r | score=%.0f",
+                                         fan_outs[i][0].company_name,
+                                         self.abr_entity_name[abr_i], score)
+                        for cc_row in fan_outs[i]:
+                            self._write_match(_build_record(
+                                cc_row, abr_i, "fuzzy_med_conf", score
+                            ))
+                        total_written += len(fan_outs[i])
+                        total_med     += len(fan_outs[i])
+
+                    for i, score in zip(survivors[ai_mask], composite[ai_mask]):
+                        # 78–81 — borderline, send to AI
+                        cc_row  = fan_outs[i][0]
+                        abr_i   = candidates[best_idx[i]]
+                        total_ai += 1
+                        if log_records:
+                            logger.debug("[AI]   %r → %r | fuzzy=%.0f",
+                                         cc_row.company_name,
+                                         self.abr_entity_name[abr_i], score)
+                        ai_items.append((
+                            cc_row.company_name,
+                            self.abr_entity_name[abr_i],
+                            float(score),
+                        ))
+                        ai_meta.append((fan_outs[i], abr_i))
+                        if len(ai_items) < self.ai_batch:
+                            continue
+
+                        fut = submit_ai(ai_items)
+                        pending_futures[fut] = ai_meta
+                        fut.add_done_callback(done_futures.put)
+                        ai_items, ai_meta = [], []
+
+                        # Drain completed AI futures so memory stays bounded
+                        if len(pending_futures) >= self.ai_workers * 2:
+                            total_written = _drain_futures(
+                                pending_futures, done_futures, total_written
+                            )
+
+                    # Progress report every 1,000 rows
+                    total_proc += int(row_counts.sum())
+                    if total_proc // 1000 > proc_before // 1000:
+                        _report_progress()
+
+            # ── Submit the last partial batch, drain all remaining futures ────
+            if ai_items:
+                fut = submit_ai(ai_items)
+                pending_futures[fut] = ai_meta
+                fut.add_done_callback(done_futures.put)
 
-            # ── Drain all remaining AI futures ────────────────────────────────
             print("\nWaiting for remaining AI calls to finish …")
-            for fut in as_completed(pending_futures):
-                cc_row, abr_row, _ = pending_futures[fut]
-                try:
-                    approved, confidence = fut.result()
-                except Exception as exc:
-                    print(f"  [AI ERROR] {exc}")
-                    continue
-                if approved:
-                    self._write_match(_build_record(
-                        cc_row, abr_row, "ai_validated", confidence * 100
-                    ))
-                    total_written += 1
+            total_written = _drain_futures(
+                pending_futures, done_futures, total_written, block=True
+            )
+
+        # ── Flush whatever is left in the write buffers ───────────────────────
+        self._flush_matches()
+        self._flush_ai_logs()
+        self.ai_validator.save_cache()
 
         # ── Final summary ─────────────────────────────────────────────────────
         elapsed = time.perf_counter() - start
@@ -475,13 +862,19 @@ class EntityMatcher:
     # ── Entry point ───────────────────────────────────────────────────────────
 
     def run(self) -> None:
-        cc_df, abr_df = self.load_data()
-        self.fuzzy_match(cc_df, abr_df)
+        abr_df   = self.load_abr()
+        total_cc = self.count_cc()
+        print(f"Common Crawl records : {total_cc:,}")
+        self.fuzzy_match(self.iter_cc(), abr_df, total_records=total_cc)
 
 
 # ── CLI ───────────────────────────────────────────────────────────────────────
 
 if __name__ == "__main__":
+    # Root stays at INFO so asyncio / httpx debug chatter stays quiet;
+    # only this module's logger is lowered to DEBUG for debug=True
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    logger.setLevel(logging.DEBUG)
     matcher = EntityMatcher(
         db_password="firmable",
         ai_workers=6,    # safe sweet spot for 8 GB RAM
@@ -1,81 +1,55 @@
-import re
-import pandas as pd
 from sqlalchemy import text
 from src.db.connection import PostgresConnector
 
+# Whole clean step in one statement, so rows never leave the database.
+# Suffixes are stripped from the lower-cased name ("pty ltd" wins over
+# "pty" — Postgres regexes take the longest match), then punctuation,
+# then whitespace is collapsed. \y is Postgres' word boundary.
+_CLEAN_ABR = text(r"""
+    WITH active AS (
+        SELECT abn,
+               initcap(regexp_replace(entity_name, '^\s+|\s+$', '', 'g')) AS entity_name,
+               entity_type, entity_status, address_line, postcode, state, start_date
+        FROM staging.abr_raw
+        WHERE entity_name ~ '\S'
+          AND entity_status = 'ACT'
+    )
+    INSERT INTO staging.abr_clean (
+        abn, entity_name, normalized_name, entity_type, entity_status,
+        address_line, postcode, state, start_date
+    )
+    SELECT DISTINCT ON (abn)
+           abn,
+           entity_name,
+           btrim(regexp_replace(regexp_replace(regexp_replace(
+               lower(entity_name),
+               '\y(pty ltd|ltd|limited|pty)\y', '', 'g'),
+               '[^\w\s]', '', 'g'),
+               '\s+', ' ', 'g')),
+           entity_type, entity_status, address_line, postcode, state, start_date
+    FROM active
+    ORDER BY abn
+""")
+
 
 class ABRCleaner:
     def __init__(self, db_password):
         self.db = PostgresConnector(password=db_password)
 
-    # ---------------------------------
-    # Normalize Company Name
-    # ---------------------------------
-    def normalize_name(self, name):
-        if not name:
-            return None
-
-        name = name.lower()
-
-        name = re.sub(r"\bpty ltd\b", "", name)
-        name = re.sub(r"\bltd\b", "", name)
-        name = re.sub(r"\blimited\b", "", name)
-        name = re.sub(r"\bpty\b", "", name)
-
-        name = re.sub(r"[^\w\s]", "", name)
-        name = re.sub(r"\s+", " ", name)
-
-        return name.strip()
-
     # ---------------------------------
     # Run Cleaning
     # ---------------------------------
     def run(self):
-        print("Loading ABR raw data...")
-
-        query = """
-        SELECT abn, entity_name, entity_type, entity_status,
-               address_line, postcode, state, start_date
-        FROM staging.abr_raw
-        """
-
-        df = pd.read_sql(query, self.db.engine)
-
-        print(f"Loaded {len(df)} raw ABR records")
-
-        # Remove null names
-        df = df[df["entity_name"].notnull()]
-        df = df[df["entity_name"].str.strip() != ""]
-
-        # Keep only active entities
-        df = df[df["entity_status"] == "ACT"]
+        print("Cleaning ABR raw data...")
 
-        # Standardize casing
-        df["entity_name"] = df["entity_name"].str.strip().str.title()
-
-        # Create normalized name
-        df["normalized_name"] = df["entity_name"].apply(self.normalize_name)
-
-        # Deduplicate by ABN
-        df = df.drop_duplicates(subset=["abn"])
-
-        print(f"{len(df)} records remaining after cleaning")
-
-        # Clear existing clean table (dev purpose)
+        # Filter active, named entities, standardise casing, normalise names
+        # and deduplicate by ABN inside Postgres; clear the clean table
+        # (dev purpose) in the same transaction
         with self.db.engine.begin() as conn:
-            conn.execute(text("DELETE FROM staging.abr_clean"))
-
-        # Insert into clean table
-        df.to_sql(
-            name="abr_clean",
-            con=self.db.engine,
-            schema="staging",
-            if_exists="append",
-            index=False,
-            method="multi",
-        )
+            conn.execute(text("TRUNCATE staging.abr_clean"))
+            inserted = conn.execute(_CLEAN_ABR).rowcount
 
-        print("Data inserted into staging.abr_clean")
+        print(f"{inserted} records inserted into staging.abr_clean")
 
 
 # ---------------------------------
@@ -1,117 +1,67 @@
-import re
-import pandas as pd
 from sqlalchemy import text
 from src.db.connection import PostgresConnector
 
+# Whole clean step in one statement, so rows never leave the database.
+#   titled      – drop empty, number-led (numeric-only, "12 Smith St …"),
+#                 .au-domain and very short titles; keep the part before
+#                 " - "; trim and title-case
+#   normalized  – strip business suffixes and marketing phrases from the
+#                 lower-cased name (Postgres regexes take the longest
+#                 match, so "pty ltd" goes as one), then punctuation, then
+#                 collapse whitespace. \y is Postgres' word boundary.
+# Rows whose normalized name ends up empty are dropped, and the rest are
+# deduplicated on it.
+_CLEAN_COMMONCRAWL = text(r"""
+    WITH titled AS (
+        SELECT website_url,
+               initcap(regexp_replace(
+                   split_part(company_name, ' - ', 1), '^\s+|\s+$', '', 'g'
+               )) AS company_name,
+               industry
+        FROM staging.commoncrawl_raw
+        WHERE company_name ~ '\S'
+          AND company_name !~* '^\d|\.au$'
+          AND char_length(company_name) >= 4
+    ),
+    normalized AS (
+        SELECT website_url,
+               company_name,
+               btrim(regexp_replace(regexp_replace(regexp_replace(
+                   lower(company_name),
+                   '\y(pty ltd|ltd|limited|pty|introducing|official website|home|welcome)\y',
+                   '', 'g'),
+                   '[^\w\s]', '', 'g'),
+                   '\s+', ' ', 'g')) AS normalized_name,
+               industry
+        FROM titled
+    )
+    INSERT INTO staging.commoncrawl_clean (
+        website_url, company_name, normalized_name, industry
+    )
+    SELECT DISTINCT ON (normalized_name)
+           website_url, company_name, normalized_name, industry
+    FROM normalized
+    WHERE normalized_name <> ''
+    ORDER BY normalized_name
+""")
+
 
 class CommonCrawlCleaner:
     def __init__(self, db_password):
         self.db = PostgresConnector(password=db_password)
 
-    # ---------------------------
-    # Normalize Company Name
-    # ---------------------------
-    def normalize_name(self, name):
-        if not name:
-            return None
-
-        name = name.lower()
-
-        # Remove common business suffixes
-        name = re.sub(r"\bpty ltd\b", "", name)
-        name = re.sub(r"\bltd\b", "", name)
-        name = re.sub(r"\blimited\b", "", name)
-        name = re.sub(r"\bpty\b", "", name)
-
-        # Remove marketing phrases
-        name = re.sub(r"\bintroducing\b", "", name)
-        name = re.sub(r"\bofficial website\b", "", name)
-        name = re.sub(r"\bhome\b", "", name)
-        name = re.sub(r"\bwelcome\b", "", name)
-
-        # Remove punctuation
-        name = re.sub(r"[^\w\s]", "", name)
-
-        # Remove extra spaces
-        name = re.sub(r"\s+", " ", name)
-
-        return name.strip()
-
-    # ---------------------------
-    # Clean Raw Data
-    # ---------------------------
-    def clean_dataframe(self, df):
-
-        # Remove null or empty names
-        df = df[df["company_name"].notnull()]
-        df = df[df["company_name"].str.strip() != ""]
-
-        # Remove numeric-only names
-        df = df[~df["company_name"].str.match(r"^\d+$")]
-
-        # Remove names that look like addresses (start with number + street)
-        df = df[~df["company_name"].str.match(r"^\d+\s+\w+", na=False)]
-
-        # Remove domain-looking titles
-        df = df[~df["company_name"].str.contains(r"\.au$", case=False, na=False)]
-
-        # Remove very short names
-        df = df[df["company_name"].str.len() >= 4]
-
-        # Remove names that start with number
-        df = df[~df["company_name"].str.match(r"^\d", na=False)]
-
-        # Handle titles like "Name - Something"
-        df["company_name"] = df["company_name"].apply(
-            lambda x: x.split(" - ")[0] if " - " in x else x
-        )
-
-        # Standardize casing
-        df["company_name"] = df["company_name"].str.strip().str.title()
-
-        # Create normalized_name
-        df["normalized_name"] = df["company_name"].apply(self.normalize_name)
-
-        # Remove rows where normalized name becomes empty
-        df = df[df["normalized_name"].notnull()]
-        df = df[df["normalized_name"].str.strip() != ""]
-
-        # Drop duplicates
-        df = df.drop_duplicates(subset=["normalized_name"])
-
-        return df
-
     # ---------------------------
     # Run Cleaning Pipeline
     # ---------------------------
     def run(self):
-        query = """
-        SELECT website_url, company_name, industry
-        FROM staging.commoncrawl_raw
-        """
-
-        df = pd.read_sql(query, self.db.engine)
+        print("Cleaning Common Crawl raw data...")
 
-        print(f"Loaded {len(df)} raw records")
-
-        df_clean = self.clean_dataframe(df)
-
-        print(f"{len(df_clean)} records remaining after cleaning")
-
-        # Clear existing clean table before insert
+        # Clear existing clean table before insert, in the same transaction
         with self.db.engine.begin() as conn:
-            conn.execute(text("DELETE FROM staging.commoncrawl_clean"))
-
-        df_clean.to_sql(
-            name="commoncrawl_clean",
-            con=self.db.engine,
-            schema="staging",
-            if_exists="append",
-            index=False,
-            method="multi",
-        )
+            conn.execute(text("TRUNCATE staging.commoncrawl_clean"))
+            inserted = conn.execute(_CLEAN_COMMONCRAWL).rowcount
 
-        print("Data inserted into staging.commoncrawl_clean")
+        print(f"{inserted} records inserted into staging.commoncrawl_clean")
 
 
 # ---------------------------